@@ -1,11 +1,18 @@
 import dash
-from dash import html
+from dash import dcc, html
 import dash_bootstrap_components as dbc
+from flask import Response, abort, jsonify, request, send_file
 from dash_iconify import DashIconify
+from utils.instrumentation import instrument_server, render_metrics
+from utils import export
 
 app = dash.Dash(__name__, use_pages=True, suppress_callback_exceptions=True, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
 app.title = "PharmaTrace"
+# Serveur Flask exposé pour gunicorn (app:server)
+server = app.server
+# Durée, taille des réponses et lignes lues de chaque callback (voir /metrics)
+instrument_server(server)
 
 navbar = dbc.NavbarSimple(
     brand=[
@@ -19,16 +26,67 @@ navbar = dbc.NavbarSimple(
         dbc.NavItem(dbc.NavLink("Accueil", href="/")),
         dbc.NavItem(dbc.NavLink("Heatmap", href="/heatmap")),
         dbc.NavItem(dbc.NavLink("Exploration", href="/exploration")),
+        dbc.NavItem(dbc.NavLink("Signaux", href="/signaux")),
+        dbc.NavItem(dbc.NavLink("Tendances", href="/tendances")),
     ],
     className="mb-4"
 )
 
 app.layout = dbc.Container([
     navbar,
+    # Filtres croisés de l'exploration, partagés entre les pages de la session
+    dcc.Store(id="filtres-exploration", storage_type="session", data={}),
     dbc.Row([
         dbc.Col(dash.page_container)
     ])
 ], fluid=True)
 
+@server.route("/metrics")
+def metrics():
+    # Histogrammes des callbacks et des chargements, compteurs des caches, au format Prometheus
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@server.route("/export/effets.<path:fmt>")
+def export_stream(fmt):
+    # Export au format long écrit en flux : ?product=...&country=...&sex=...&from=AAAA-MM-JJ&to=AAAA-MM-JJ
+    if fmt not in export.FORMATS:
+        abort(404)
+    if not export.format_available(fmt):
+        return Response("L'export Parquet nécessite pyarrow", status=501, mimetype="text/plain")
+    try:
+        filtres = export.filters_from_args(request.args)
+    except ValueError as e:
+        return Response(str(e), status=400, mimetype="text/plain")
+    mimetype, extension = export.FORMATS[fmt]
+    return Response(export.stream_export(fmt, **filtres), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=effets_secondaires.{extension}"})
+
+@server.route("/export/jobs", methods=["POST"])
+def export_job():
+    # Même filtres que /export/effets.<format>, plus format=csv|csv.gz|parquet
+    fmt = request.values.get("format", "csv")
+    if not export.format_available(fmt):
+        return jsonify(error=f"Format d'export indisponible : {fmt}"), 501 if fmt in export.FORMATS else 400
+    try:
+        job_id = export.jobs.submit(fmt, **export.filters_from_args(request.values))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(id=job_id, status=f"/export/jobs/{job_id}", download=f"/export/jobs/{job_id}/download"), 202
+
+@server.route("/export/jobs/<job_id>")
+def export_job_status(job_id):
+    statut = export.jobs.status(job_id)
+    if statut is None:
+        abort(404)
+    return jsonify(statut)
+
+@server.route("/export/jobs/<job_id>/download")
+def export_job_download(job_id):
+    chemin = export.jobs.file(job_id)
+    if chemin is None:
+        abort(404)
+    extension = export.FORMATS[export.jobs.status(job_id)["format"]][1]
+    return send_file(chemin, as_attachment=True, download_name=f"effets_secondaires.{extension}")
+
 if __name__ == "__main__":
     app.run(debug=False,host="0.0.0.0", port=8000)
\ No newline at end of file
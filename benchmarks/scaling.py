@@ -0,0 +1,141 @@
+"""Benchmark de passage à l'échelle sur des jeux synthétiques (utils.synthetic).
+
+Pour chaque taille, un processus séparé (mémoire vierge, store dédié) mesure
+la construction du store, load_data(), load_country_counts(), chaque fonction de
+utils/graphs.py, le callback update_heatmap et l'export CSV en flux de la heatmap :
+durée à froid, meilleure durée à chaud et pic de mémoire (tracemalloc).
+
+    python -m benchmarks.scaling --sizes 10k,100k,1M,10M --json resultats.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = "10k,100k,1M,10M"
+
+
+def _mesurer(nom, fonction, repetitions):
+    # Appel à froid, appel sous tracemalloc (pic mémoire), puis appels à chaud
+    debut = time.perf_counter()
+    fonction()
+    froid = time.perf_counter() - debut
+
+    tracemalloc.start()
+    fonction()
+    pic = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    chaud = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        chaud.append(time.perf_counter() - debut)
+    return {"step": nom, "cold_s": froid, "warm_s": min(chaud) if chaud else None, "peak_mb": pic / 2 ** 20}
+
+
+def run_worker(repetitions):
+    # Exécuté dans le sous-processus : PHARMATRACE_DATA et PHARMATRACE_CACHE_DIR sont déjà positionnés
+    sys.path.insert(0, BASE_DIR)
+    from utils import data_loader
+    from utils import export
+    from utils import graphs
+    from utils.bitmaps import filtered_summary
+    from utils.search import search_products
+
+    yield _mesurer("build_store", lambda: data_loader.build_store(force=True), 0)
+
+    import app  # noqa: F401  (enregistre les pages et leurs callbacks)
+    heatmap = sys.modules["pages.Heatmap"]
+    st = data_loader.get_store()
+    summary = st.summary
+    produits = search_products(st, "", limite=10)
+
+    def sans_cache(callback, *args):
+        def appel():
+            heatmap.resultats_cache.clear()
+            return callback(*args)
+        return appel
+
+    etapes = [
+        ("load_data", data_loader.load_data),
+        ("load_country_counts", data_loader.load_country_counts),
+        ("sexe_distribution_graph", lambda: graphs.sexe_distribution_graph(summary)),
+        ("age_distribution_graph", lambda: graphs.age_distribution_graph(summary)),
+        ("top_effects_graph", lambda: graphs.top_effects_graph(summary)),
+        ("top_products_graph", lambda: graphs.top_products_graph(summary)),
+        ("year_distribution_graph", lambda: graphs.year_distribution_graph(filtered_summary())),
+        ("plot_world_map", graphs.plot_world_map),
+        ("update_heatmap (top 10)", sans_cache(heatmap.update_heatmap, produits)),
+        ("export CSV en flux (top 10)", lambda: sum(len(m) for m in export.stream_export("csv", products=produits))),
+    ]
+    for nom, fonction in etapes:
+        yield _mesurer(nom, fonction, repetitions)
+    # ru_maxrss est en kilo-octets sous Linux
+    yield {"step": "max RSS", "cold_s": None, "warm_s": None,
+           "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def run_size(taille, dossier, repetitions, seed):
+    from utils.synthetic import parse_size, write_synthetic
+
+    n = parse_size(taille)
+    csv = os.path.join(dossier, f"synthetic-{taille}.csv")
+    if not os.path.exists(csv):
+        print(f"Génération de {n} déclarations -> {csv}", file=sys.stderr)
+        write_synthetic(n, csv, seed=seed)
+
+    env = dict(os.environ, PHARMATRACE_DATA=csv, PHARMATRACE_CACHE_DIR=os.path.join(dossier, f"cache-{taille}"))
+    env.pop("PHARMATRACE_RESULT_CACHE_DIR", None)
+    sortie = subprocess.run(
+        [sys.executable, "-m", "benchmarks.scaling", "--worker", "--repeat", str(repetitions)],
+        cwd=BASE_DIR, env=env, check=True, stdout=subprocess.PIPE, text=True,
+    ).stdout
+    return [dict(json.loads(ligne), size=taille, rows=n) for ligne in sortie.splitlines() if ligne.startswith("{")]
+
+
+def _format(valeur, motif):
+    return "-" if valeur is None else motif.format(valeur)
+
+
+def print_table(resultats):
+    print(f"{'taille':>7}  {'étape':<28} {'froid (s)':>10} {'chaud (s)':>10} {'pic (Mo)':>10}")
+    for r in resultats:
+        print(f"{r['size']:>7}  {r['step']:<28} {_format(r['cold_s'], '{:.3f}'):>10} "
+              f"{_format(r['warm_s'], '{:.3f}'):>10} {_format(r['peak_mb'], '{:.1f}'):>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de passage à l'échelle sur données synthétiques")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"tailles séparées par des virgules ({DEFAULT_SIZES})")
+    parser.add_argument("--data-dir", default=os.path.join(BASE_DIR, ".cache", "benchmarks"),
+                        help="répertoire des CSV synthétiques et des stores (réutilisés d'un lancement à l'autre)")
+    parser.add_argument("--repeat", type=int, default=1, help="appels à chaud par étape")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="fichier où écrire les résultats")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        for resultat in run_worker(args.repeat):
+            print(json.dumps(resultat), flush=True)
+        return
+
+    sys.path.insert(0, BASE_DIR)
+    os.makedirs(args.data_dir, exist_ok=True)
+    resultats = []
+    for taille in args.sizes.split(","):
+        resultats += run_size(taille.strip(), args.data_dir, args.repeat, args.seed)
+    print_table(resultats)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
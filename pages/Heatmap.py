@@ -1,91 +1,150 @@
+import os
+import re
+from urllib.parse import urlencode
 import dash
 from dash import dcc, html, Input, Output, State, dash_table, ctx
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 import plotly.express as px
+import numpy as np
 import pandas as pd
-from utils.data_loader import load_data
-from collections import Counter
+from utils.data_loader import get_store
+from utils.aggregations import product_reaction_counts
+from utils.cache import ResultCache
+from utils.search import search_options, search_products
+from utils import export
 
 # Enregistrement de la page
 dash.register_page(__name__, path="/heatmap", name="Heatmap")
 
-# Chargement des données
-df = load_data()
-produits_uniques = sorted({p for liste in df['product_names'] for p in liste})
-
-layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-            html.Div(style={"height": "40px"}),
-            html.H2("Heatmap des effets secondaires par médicament", className="mb-4 text-center"),
-            html.P("Sélectionnez un ou plusieurs médicaments pour afficher la fréquence des effets secondaires associés."),
-            dcc.Dropdown(
-                options=[{"label": p, "value": p} for p in produits_uniques],
-                value=[produits_uniques[0]],
-                multi=True,
-                id="dropdown-produits",
-                style={"width": "100%"}
-            ),
-            html.Div(id="heatmap-stats", className="text-info my-3 text-center"),
-            dcc.Loading(
-                dcc.Graph(id="heatmap", className="centered-plot", style={"width": "100%", "height": "450px"}),
-                type="default"
-            ),
-            html.Div(id="info-empty", className="text-muted mt-3 text-center"),
-            html.P("""
-                Cette heatmap permet de visualiser l’intensité des effets secondaires en fonction des médicaments sélectionnés.
-                Plus la couleur est intense, plus l’effet secondaire est fréquemment rapporté pour ce médicament.
-                Cela permet d’identifier rapidement les réactions spécifiques à certains produits, ainsi que les tendances globales de pharmacovigilance.
-            """, className="mt-4 text-justify"),
-
-            html.Div(style={"height": "30px"}),
-
-            html.H3("Tableau des effets secondaires", className="text-center mt-5 mb-3"),
-            html.Div(style={"height": "20px"}),
-            html.Div(id="table-container", className="mb-4"),
-            html.Div(style={"height": "30px"}),
-
-            html.Div([
-                html.Button("Exporter en CSV", id="btn-export", className="btn btn-primary my-3"),
-                dcc.Download(id="download-dataframe")
-            ], className="text-center mb-4"),
-
-            html.Div(style={"height": "30px"}),
-            html.H3("Répartition des effets secondaires", className="text-center mt-5 mb-3"),
-            html.Div(style={"height": "30px"}),
-            html.Div(id="barplot-container")
-        ], width=12)
-    ])
-], fluid=True)
+# Tableau au format long : une ligne par couple (produit, effet)
+COLONNES_TABLE = ["Produit", "Effet secondaire", "Nombre de cas"]
+# Colonnes numériques : une saisie nue ("5") y est une égalité, pas un "contains"
+COLONNES_NUMERIQUES = ["Nombre de cas"]
+OPERATEURS_FILTRE = [
+    ["ge ", ">="], ["le ", "<="], ["lt ", "<"], ["gt ", ">"], ["ne ", "!="], ["eq ", "="],
+    ["contains "], ["datestartswith "],
+]
 
-@dash.callback(
-    Output("heatmap", "figure"),
-    Output("info-empty", "children"),
-    Output("heatmap-stats", "children"),
-    Output("table-container", "children"),
-    Output("barplot-container", "children"),
-    Input("dropdown-produits", "value")
+# Résultats par sélection de produits, partagés entre update_heatmap et update_table
+resultats_cache = ResultCache(
+    "heatmap",
+    maxsize=int(os.environ.get("PHARMATRACE_RESULT_CACHE_SIZE", "64")),
+    ttl=int(os.environ.get("PHARMATRACE_RESULT_CACHE_TTL", "3600")),
+    disk_dir=os.environ.get("PHARMATRACE_RESULT_CACHE_DIR"),
+    max_disk_bytes=int(os.environ.get("PHARMATRACE_RESULT_CACHE_DISK_BYTES", str(256 * 1024 * 1024))),
 )
-def update_heatmap(produits_selection):
-    if not produits_selection:
-        fig = go.Figure(go.Heatmap(z=[[0]], x=["Effets"], y=["Produit"]))
-        fig.update_layout(plot_bgcolor="#1e1e2f", paper_bgcolor="#1e1e2f")
-        return fig, "Veuillez sélectionner au moins un produit.", "", "", ""
 
-    df_filtered = df[df['product_names'].apply(lambda x: any(p in x for p in produits_selection))]
-    data = {p: Counter() for p in produits_selection}
-    for _, row in df_filtered.iterrows():
-        for p in row['product_names']:
-            if p in produits_selection:
-                data[p].update(row['reactions'])
+def _options(st, produits):
+    # Libellé avec le nombre de déclarations ; "search" (forme normalisée et alias
+    # marque/générique) évite que le filtre côté navigateur masque les résultats du serveur
+    ids = dict(zip(produits, st.term_ids('product_names', produits)))
+    comptes = st.term_counts('product_names')
+    return search_options(st, "product_names", produits,
+                          lambda p: f"{p} ({comptes[ids[p]] if ids[p] >= 0 else 0})")
+
+def layout():
+    # Seul le produit le plus déclaré est envoyé avec la page ; les autres options
+    # sont chargées à la frappe par update_options
+    st = get_store()
+    produit_initial = search_products(st, "", limite=1)
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                html.Div(style={"height": "40px"}),
+                html.H2("Heatmap des effets secondaires par médicament", className="mb-4 text-center"),
+                html.P("Sélectionnez un ou plusieurs médicaments pour afficher la fréquence des effets secondaires associés."),
+                dcc.Dropdown(
+                    options=_options(st, produit_initial),
+                    value=produit_initial,
+                    multi=True,
+                    placeholder="Rechercher un médicament…",
+                    id="dropdown-produits",
+                    style={"width": "100%"}
+                ),
+                html.Div(id="heatmap-stats", className="text-info my-3 text-center"),
+                dcc.Loading(
+                    dcc.Graph(id="heatmap", className="centered-plot", style={"width": "100%", "height": "450px"}),
+                    type="default"
+                ),
+                html.Div(id="info-empty", className="text-muted mt-3 text-center"),
+                html.P("""
+                    Cette heatmap permet de visualiser l’intensité des effets secondaires en fonction des médicaments sélectionnés.
+                    Plus la couleur est intense, plus l’effet secondaire est fréquemment rapporté pour ce médicament.
+                    Cela permet d’identifier rapidement les réactions spécifiques à certains produits, ainsi que les tendances globales de pharmacovigilance.
+                """, className="mt-4 text-justify"),
+
+                html.Div(style={"height": "30px"}),
+
+                html.H3("Tableau des effets secondaires", className="text-center mt-5 mb-3"),
+                html.Div(style={"height": "20px"}),
+                html.Div(
+                    dash_table.DataTable(
+                        id="table-effets",
+                        columns=[
+                            {"name": nom, "id": nom, "type": "numeric"} if nom in COLONNES_NUMERIQUES
+                            else {"name": nom, "id": nom}
+                            for nom in COLONNES_TABLE
+                        ],
+                        page_current=0,
+                        page_size=20,
+                        page_action="custom",
+                        sort_action="custom",
+                        sort_mode="multi",
+                        sort_by=[{"column_id": "Nombre de cas", "direction": "desc"}],
+                        filter_action="custom",
+                        filter_query="",
+                        style_table={"overflowX": "auto"},
+                        style_header={"backgroundColor": "#1e2130", "color": "white"},
+                        style_filter={"backgroundColor": "#1e2130", "color": "white"},
+                        style_cell={"backgroundColor": "#272b3f", "color": "white", "textAlign": "center", "padding": "5px"}
+                    ),
+                    id="table-container", className="mb-4"
+                ),
+                html.Div(style={"height": "30px"}),
+
+                html.Div([
+                    html.A("Exporter en CSV", id="btn-export", className="btn btn-primary my-3", download="")
+                ], className="text-center mb-4"),
 
-    all_effects = sorted({effet for d in data.values() for effet in d})
-    heatmap_data = pd.DataFrame(index=produits_selection, columns=all_effects).fillna(0)
-    for p in produits_selection:
-        for effet in data[p]:
-            heatmap_data.loc[p, effet] = data[p][effet]
+                dbc.Card(dbc.CardBody([
+                    html.H5("Export complet", className="mb-3"),
+                    html.P(
+                        "Couples médicament – effet au format long, pour la sélection ou pour tous les médicaments, "
+                        "avec filtres optionnels. Le fichier est produit en arrière-plan puis proposé au téléchargement.",
+                        className="text-muted"
+                    ),
+                    dbc.Row([
+                        dbc.Col(dcc.Dropdown(
+                            options=[{"label": "CSV", "value": "csv"}, {"label": "CSV compressé (gzip)", "value": "csv.gz"},
+                                     {"label": "Parquet", "value": "parquet", "disabled": not export.format_available("parquet")}],
+                            value="csv", clearable=False, id="export-format"
+                        ), md=3),
+                        dbc.Col(dcc.DatePickerRange(id="export-dates", display_format="DD/MM/YYYY",
+                                                    start_date_placeholder_text="Début", end_date_placeholder_text="Fin"), md=4),
+                        dbc.Col(dcc.Dropdown(options=[p for p, _ in st.summary["countries"]], multi=True,
+                                             placeholder="Tous les pays", id="export-pays"), md=3),
+                        dbc.Col(dcc.Dropdown(options=st["sex.labels"].tolist(), multi=True,
+                                             placeholder="Tous", id="export-sexe"), md=2),
+                    ], className="mb-3"),
+                    dcc.Checklist(options=[{"label": " Tous les médicaments", "value": "tous"}], value=[],
+                                  id="export-tous", className="mb-3"),
+                    html.Button("Lancer l'export", id="btn-export-complet", className="btn btn-primary"),
+                    html.Div(id="export-statut", className="text-info mt-3"),
+                    dcc.Store(id="export-job"),
+                    dcc.Interval(id="export-poll", interval=1000, disabled=True),
+                ]), className="mb-4"),
 
+                html.Div(style={"height": "30px"}),
+                html.H3("Répartition des effets secondaires", className="text-center mt-5 mb-3"),
+                html.Div(style={"height": "30px"}),
+                html.Div(id="barplot-container")
+            ], width=12)
+        ])
+    ], fluid=True)
+
+def _figure_heatmap(heatmap_data):
     fig = go.Figure(data=go.Heatmap(
         z=heatmap_data.values,
         x=heatmap_data.columns,
@@ -108,18 +167,17 @@ def update_heatmap(produits_selection):
         title_x=0.5
     )
     fig.update_xaxes(tickangle=-45)
+    return fig
+
+def _calcul_resultats(produits):
+    heatmap_data = product_reaction_counts(get_store(), produits)
 
     nb_effets = heatmap_data.shape[1]
-    nb_produits = len(produits_selection)
-
-    table_df = heatmap_data.reset_index().rename(columns={"index": "Produit"})
-    table = dash_table.DataTable(
-        data=table_df.to_dict("records"),
-        columns=[{"name": col, "id": col} for col in table_df.columns],
-        style_table={"overflowX": "auto"},
-        style_header={"backgroundColor": "#1e2130", "color": "white"},
-        style_cell={"backgroundColor": "#272b3f", "color": "white", "textAlign": "center", "padding": "5px"}
-    )
+    nb_produits = len(produits)
+
+    # Format long sans les comptes nuls, pour le tableau paginé côté serveur
+    table_df = heatmap_data.rename_axis(index="Produit", columns="Effet secondaire").stack().rename("Nombre de cas").reset_index()
+    table_df = table_df[table_df["Nombre de cas"] > 0].reset_index(drop=True)
 
     total_effects = heatmap_data.sum(axis=0).sort_values(ascending=False).reset_index()
     total_effects.columns = ["Effet secondaire", "Total"]
@@ -138,29 +196,192 @@ def update_heatmap(produits_selection):
         title_x=0.5
     )
 
-    return fig, "", f"{nb_produits} produit(s) sélectionné(s) – {nb_effets} effets secondaires détectés", table, dcc.Graph(figure=piechart, className="centered-plot")
+    return {
+        "heatmap_data": heatmap_data,
+        "table": table_df,
+        "piechart": piechart,
+        "stats": f"{nb_produits} produit(s) sélectionné(s) – {nb_effets} effets secondaires détectés",
+    }
+
+def resultats_selection(produits):
+    # Clé normalisée (triée, dédoublonnée) et liée à la version du store ; les résultats
+    # sont ensuite remis dans l'ordre de la sélection de l'utilisateur
+    demandes = list(dict.fromkeys(produits))
+    tries = sorted(demandes)
+    cle = (get_store().meta["sha256"], tuple(tries))
+    r = resultats_cache.get_or_compute(cle, lambda: _calcul_resultats(tries))
+    if demandes == tries:
+        return r
+    rang = {p: i for i, p in enumerate(demandes)}
+    table = r["table"]
+    ordre = np.argsort(table["Produit"].map(rang).to_numpy(), kind="stable")
+    return dict(r, heatmap_data=r["heatmap_data"].reindex(demandes),
+                table=table.iloc[ordre].reset_index(drop=True))
+
+@dash.callback(
+    Output("dropdown-produits", "options"),
+    Input("dropdown-produits", "search_value"),
+    State("dropdown-produits", "value")
+)
+def update_options(search_value, selection):
+    if search_value is None:
+        raise PreventUpdate
+    st = get_store()
+    selection = selection or []
+    # Les produits déjà sélectionnés restent dans les options pour rester affichés
+    trouves = [p for p in search_products(st, search_value) if p not in selection]
+    return _options(st, selection + trouves)
+
+@dash.callback(
+    Output("heatmap", "figure"),
+    Output("info-empty", "children"),
+    Output("heatmap-stats", "children"),
+    Output("barplot-container", "children"),
+    Input("dropdown-produits", "value")
+)
+def update_heatmap(produits_selection):
+    if not produits_selection:
+        fig = go.Figure(go.Heatmap(z=[[0]], x=["Effets"], y=["Produit"]))
+        fig.update_layout(plot_bgcolor="#1e1e2f", paper_bgcolor="#1e1e2f")
+        return fig, "Veuillez sélectionner au moins un produit.", "", ""
+
+    r = resultats_selection(produits_selection)
+    return _figure_heatmap(r["heatmap_data"]), "", r["stats"], dcc.Graph(figure=r["piechart"], className="centered-plot")
+
+_CLAUSE = re.compile(r"^\s*\{(?P<nom>[^}]*)\}\s*(?P<operateur>\S+)\s*(?P<valeur>.*?)\s*$")
+
+def _operateur(jeton):
+    # Forme canonique ("ge", "contains"...) ; les variantes sensibles ("s") ou non ("i") à la casse sont confondues
+    for candidat in (jeton, jeton[1:]):
+        for variantes in OPERATEURS_FILTRE:
+            if candidat in (v.strip() for v in variantes):
+                return variantes[0].strip()
+    return None
+
+def _clause_filtre(clause):
+    # "{colonne} op valeur" -> (colonne, opérateur, valeur, texte) ; l'opérateur est le jeton
+    # qui suit l'accolade fermante, jamais un mot de la valeur. Sans opérateur reconnu, tout
+    # ce qui suit l'accolade est la valeur et l'opérateur (None) dépend du type de la colonne
+    trouve = _CLAUSE.match(clause)
+    if not trouve:
+        return None, None, None, None
+    operateur = _operateur(trouve["operateur"])
+    texte = trouve["valeur"]
+    if operateur is None:
+        texte = f"{trouve['operateur']} {texte}".strip()
+    if len(texte) > 1 and texte[0] == texte[-1] and texte[0] in ("'", '"', "`"):
+        texte = texte[1:-1].replace("\\" + texte[0], texte[0])
+        valeur = texte
+    else:
+        try:
+            valeur = float(texte)
+        except ValueError:
+            valeur = texte
+    return trouve["nom"], operateur, valeur, texte
+
+def _filtrer(table, filter_query):
+    for clause in filter_query.split(" && "):
+        nom, operateur, valeur, texte = _clause_filtre(clause)
+        if nom not in table.columns:
+            continue
+        colonne = table[nom]
+        if operateur is None:
+            operateur = "eq" if pd.api.types.is_numeric_dtype(colonne) else "contains"
+        if operateur in ("contains", "datestartswith"):
+            table = table[colonne.astype(str).str.contains(texte, case=False, regex=False)]
+        elif pd.api.types.is_numeric_dtype(colonne):
+            # Une valeur non numérique sur une colonne de comptes est ignorée
+            if isinstance(valeur, float):
+                comparaisons = {"ge": colonne >= valeur, "le": colonne <= valeur, "lt": colonne < valeur,
+                                "gt": colonne > valeur, "ne": colonne != valeur, "eq": colonne == valeur}
+                table = table[comparaisons[operateur]]
+        elif operateur in ("eq", "ne"):
+            egal = colonne.astype(str).str.lower() == texte.lower()
+            table = table[egal if operateur == "eq" else ~egal]
+    return table
+
+@dash.callback(
+    Output("table-effets", "data"),
+    Output("table-effets", "page_count"),
+    Output("table-effets", "page_current"),
+    Input("dropdown-produits", "value"),
+    Input("table-effets", "page_current"),
+    Input("table-effets", "page_size"),
+    Input("table-effets", "sort_by"),
+    Input("table-effets", "filter_query")
+)
+def update_table(produits_selection, page_current, page_size, sort_by, filter_query):
+    # Seule la page visible est envoyée au navigateur
+    if not produits_selection:
+        return [], 0, 0
+
+    table = _filtrer(resultats_selection(produits_selection)["table"], filter_query or "")
+    if sort_by:
+        table = table.sort_values(
+            [s["column_id"] for s in sort_by],
+            ascending=[s["direction"] == "asc" for s in sort_by],
+            kind="stable"
+        )
+    nb_pages = max(1, -(-len(table) // page_size))
+    # Nouvelle sélection : retour à la première page
+    page = 0 if ctx.triggered_id == "dropdown-produits" else min(page_current or 0, nb_pages - 1)
+    return table.iloc[page * page_size:(page + 1) * page_size].to_dict("records"), nb_pages, page
+
+@dash.callback(
+    Output("btn-export", "href"),
+    Input("dropdown-produits", "value")
+)
+def export_csv(selected_produits):
+    # Lien vers l'export en flux du serveur : le tableau n'est jamais construit en mémoire
+    if not selected_produits:
+        return None
+    requete = urlencode([("product", p) for p in selected_produits])
+    return dash.get_relative_path(f"/export/effets.csv?{requete}")
 
 @dash.callback(
-    Output("download-dataframe", "data"),
-    Input("btn-export", "n_clicks"),
+    Output("export-job", "data"),
+    Output("export-poll", "disabled"),
+    Output("export-statut", "children"),
+    Input("btn-export-complet", "n_clicks"),
+    State("export-format", "value"),
+    State("export-dates", "start_date"),
+    State("export-dates", "end_date"),
+    State("export-pays", "value"),
+    State("export-sexe", "value"),
+    State("export-tous", "value"),
     State("dropdown-produits", "value"),
     prevent_initial_call=True
 )
-def export_csv(n_clicks, selected_produits):
-    if not selected_produits:
-        return dash.no_update
-
-    data = {p: Counter() for p in selected_produits}
-    for _, row in df[df['product_names'].apply(lambda x: any(p in x for p in selected_produits))].iterrows():
-        for p in row['product_names']:
-            if p in selected_produits:
-                data[p].update(row['reactions'])
-
-    all_effects = sorted({effet for d in data.values() for effet in d})
-    heatmap_data = pd.DataFrame(index=selected_produits, columns=all_effects).fillna(0)
-    for p in selected_produits:
-        for effet in data[p]:
-            heatmap_data.loc[p, effet] = data[p][effet]
-
-    csv_string = heatmap_data.reset_index().to_csv(index=False, encoding='utf-8')
-    return dict(content=csv_string, filename="effets_secondaires_medicaments.csv")
+def start_export(n_clicks, fmt, debut, fin, pays, sexes, tous, produits):
+    # L'export est confié au pool d'arrière-plan ; la page suit son avancement par export-poll
+    if "tous" not in (tous or []) and not produits:
+        return dash.no_update, True, "Sélectionnez au moins un médicament ou cochez « Tous les médicaments »."
+    job_id = export.jobs.submit(
+        fmt,
+        products=None if "tous" in (tous or []) else produits,
+        countries=pays or None,
+        sexes=sexes or None,
+        date_range=(debut, fin) if debut or fin else None,
+    )
+    return job_id, False, "Export en cours…"
+
+@dash.callback(
+    Output("export-statut", "children", allow_duplicate=True),
+    Output("export-poll", "disabled", allow_duplicate=True),
+    Input("export-poll", "n_intervals"),
+    State("export-job", "data"),
+    prevent_initial_call=True
+)
+def poll_export(n_intervals, job_id):
+    statut = export.jobs.status(job_id) if job_id else None
+    if statut is None:
+        return "Export introuvable.", True
+    if statut["state"] == "error":
+        return f"Échec de l'export : {statut['error']}", True
+    if statut["state"] != "done":
+        return f"Export en cours… {statut['rows']} lignes écrites", False
+    lien = html.A(
+        f"Télécharger ({statut['rows']} lignes, {statut['bytes'] / 2 ** 20:.1f} Mo)",
+        href=dash.get_relative_path(f"/export/jobs/{job_id}/download"), className="btn btn-success",
+    )
+    return lien, True
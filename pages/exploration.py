@@ -1,78 +1,192 @@
-from dash import html, dcc
+from dash import html, dcc, Input, Output, State
 import dash
 import dash_bootstrap_components as dbc
-from utils.data_loader import load_data
+from utils.bitmaps import filtered_summary
 from utils.graphs import (
     sexe_distribution_graph,
     age_distribution_graph,
     top_effects_graph,
-    top_products_graph
+    top_products_graph,
+    year_distribution_graph
 )
 
 dash.register_page(__name__, path="/exploration", name="Exploration")
 
-# Chargement des données
-df = load_data()
-
-layout = dbc.Container([
-    html.H2("Exploration des données sur les effets secondaires", className="my-5 text-center"),
-
-    dbc.Row([
-        dbc.Col([
-            html.H4("Répartition par genre", className="mb-3 text-center"),
-            dcc.Graph(figure=sexe_distribution_graph(df), id="graph-sexe", className="centered-plot"),
-            html.P("""
-               Ce graphique montre une répartition déséquilibrée des effets secondaires rapportés selon le sexe.
-                On observe que près de deux tiers des déclarations concernent des femmes.
-                Cette surreprésentation peut s’expliquer par plusieurs facteurs : une réactivité plus élevée des femmes au système de pharmacovigilance, des habitudes de consultation médicale différentes, ou encore une sensibilité biologique potentiellement accrue à certains principes actifs.
-            """, className="text-justify")
-        ])
-    ], className="mb-5"),
+# Graphique cliquable -> dimension filtrée
+GRAPHES = {
+    "graph-sexe": "sex",
+    "graph-age": "age",
+    "graph-effets": "reaction",
+    "graph-produits": "product",
+    "graph-annees": "year",
+}
+LIBELLES_FILTRES = {
+    "sex": "Sexe", "age": "Âge", "year": "Année",
+    "country": "Pays", "product": "Médicament", "reaction": "Effet",
+}
 
-    dbc.Row([
-        dbc.Col([
-            html.H4("Distribution par âge", className="mb-3 text-center"),
-            dcc.Graph(figure=age_distribution_graph(df), id="graph-age", className="centered-plot"),
-            html.P("""
-                Cette visualisation permet de comprendre quelles tranches d’âge sont les plus concernées par les effets secondaires rapportés.
-                On observe que les personnes âgées de 66 à 80 ans sont les plus touchées, avec 206 cas rapportés, suivies par la tranche 51–65 ans avec 168 cas.
-                Ces deux groupes regroupent à eux seuls la majorité des signalements, ce qui pourrait s’expliquer par une plus grande consommation de médicaments dans ces tranches d’âge, en lien avec des pathologies chroniques ou des traitements au long cours.
-                Les tranches plus jeunes, comme 0–18 ans et 19–35 ans, présentent un nombre de cas nettement inférieur (38 et 67 cas respectivement), ce qui peut refléter une exposition médicamenteuse plus faible, une meilleure tolérance, ou encore une sous-déclaration des effets secondaires dans ces populations.
-                Ce type de visualisation est essentiel pour orienter les efforts de pharmacovigilance et adapter les messages de prévention selon les groupes d’âge les plus exposés.
+def layout():
+    # Les figures sont calculées par update_exploration selon les filtres de la session
+    return dbc.Container([
+        html.H2("Exploration des données sur les effets secondaires", className="my-5 text-center"),
 
+        dbc.Row([
+            dbc.Col(html.P(
+                "Cliquez sur une barre (ou sur un pays de la carte d'accueil) pour filtrer tous les graphiques ; "
+                "un second clic sur la même barre retire le filtre.",
+                className="text-justify"
+            ), md=8),
+            dbc.Col(dbc.Button("Réinitialiser les filtres", id="filtres-reset", color="secondary", size="sm"),
+                    md=4, className="text-end"),
+        ]),
+        html.Div(id="filtres-actifs", className="mb-5"),
 
-            """, className="text-justify")
-        ])
-    ], className="mb-5"),
-
-    dbc.Row([
-        dbc.Col([
-            html.H4("Top 10 effets secondaires", className="mb-3 text-center"),
-            dcc.Graph(figure=top_effects_graph(df), id="graph-effets", className="centered-plot"),
-            html.P("""
-                Ce graphique présente les 10 effets secondaires les plus fréquemment déclarés dans notre échantillon de données issues de pharmacovigilance.
-                En tête, on retrouve la fièvre (Pyrexia), avec plus de 70 cas rapportés, suivie de la douleur (Pain) et de la dyspnée (essoufflement), avec respectivement 62 et 57 signalements. Ces réactions figurent parmi les plus courantes dans les déclarations d’effets secondaires, quel que soit le type de médicament concerné.
-                Des symptômes tels que le malaise, la fatigue, la nausée et les maux de tête apparaissent également de manière significative, avec des fréquences proches (autour de 50 cas).
-                En revanche, des réactions comme l’éruption cutanée (Rash) ou les syndromes pseudo-grippaux (Influenza) sont moins souvent rapportés dans cet échantillon.
-                Cette distribution permet de cibler les effets les plus courants à travers les différentes classes médicamenteuses, afin d’améliorer l’information aux patients et la vigilance des professionnels de santé.
-            """, className="text-justify")
-        ])
-    ], className="mb-5"),
-
-    dbc.Row([
-        dbc.Col([
-            html.H4("Top 10 des médicaments associés à des effets secondaires", className="mb-3 text-center"),
-            dcc.Graph(figure= top_products_graph(df), id="graph-produits", className="centered-plot"),
-            html.P("""
-                Ce graphique présente les 10 médicaments les plus fréquemment associés à des effets secondaires dans le jeu de données.
-                Le médicament XOLAIR se démarque très nettement avec près de 250 cas rapportés, ce qui en fait le produit le plus fréquemment lié à des effets secondaires dans cet échantillon.
-                Viennent ensuite Influenza et HUMIRA, avec respectivement environ 130 et 105 signalements, indiquant également une vigilance accrue autour de ces traitements.
-                D’autres produits comme DEXAMETHASONE, ASPIRIN ou REVLIMID affichent des volumes de déclarations plus modérés, oscillant entre 70 et 60 cas.
-                Enfin, PREDNISONE, SOLIRIS, ENBREL et OMEPRAZOLE clôturent ce classement avec un peu moins de 50 déclarations chacun.
-                Il est essentiel de noter que ce type de visualisation ne permet pas à elle seule de conclure à une plus grande dangerosité de certains médicaments.
-                Le volume de prescriptions, le profil des patients (âge, comorbidités), ou encore le niveau de surveillance peuvent fortement influencer le nombre de signalements.
-                Ce graphique constitue néanmoins un outil d’orientation précieux pour identifier les molécules nécessitant une analyse plus approfondie en pharmacovigilance.
-            """, className="text-justify")
+        dbc.Row([
+            dbc.Col([
+                html.H4("Répartition par genre", className="mb-3 text-center"),
+                dcc.Graph(id="graph-sexe", className="centered-plot"),
+                html.P(id="texte-sexe", className="text-justify"),
+                html.P("""
+                    Un déséquilibre entre les sexes peut s’expliquer par plusieurs facteurs : une réactivité plus élevée des femmes au système de pharmacovigilance, des habitudes de consultation médicale différentes, ou encore une sensibilité biologique potentiellement accrue à certains principes actifs.
+                """, className="text-justify")
+            ])
+        ], className="mb-5"),
+
+        dbc.Row([
+            dbc.Col([
+                html.H4("Distribution par âge", className="mb-3 text-center"),
+                dcc.Graph(id="graph-age", className="centered-plot"),
+                html.P(id="texte-age", className="text-justify"),
+                html.P("""
+                    Les tranches âgées concentrent souvent les signalements, ce qui pourrait s’expliquer par une plus grande consommation de médicaments, en lien avec des pathologies chroniques ou des traitements au long cours ; à l’inverse, un faible nombre de cas chez les plus jeunes peut refléter une exposition médicamenteuse plus faible, une meilleure tolérance, ou une sous-déclaration.
+                    Ce type de visualisation est essentiel pour orienter les efforts de pharmacovigilance et adapter les messages de prévention selon les groupes d’âge les plus exposés.
+                """, className="text-justify")
+            ])
+        ], className="mb-5"),
+
+        dbc.Row([
+            dbc.Col([
+                html.H4("Top 10 effets secondaires", className="mb-3 text-center"),
+                dcc.Graph(id="graph-effets", className="centered-plot"),
+                html.P(id="texte-effets", className="text-justify"),
+                html.P("""
+                    Cette distribution permet de cibler les effets les plus courants à travers les différentes classes médicamenteuses, afin d’améliorer l’information aux patients et la vigilance des professionnels de santé.
+                """, className="text-justify")
+            ])
+        ], className="mb-5"),
+
+        dbc.Row([
+            dbc.Col([
+                html.H4("Top 10 des médicaments associés à des effets secondaires", className="mb-3 text-center"),
+                dcc.Graph(id="graph-produits", className="centered-plot"),
+                html.P(id="texte-produits", className="text-justify"),
+                html.P("""
+                    Il est essentiel de noter que ce type de visualisation ne permet pas à elle seule de conclure à une plus grande dangerosité de certains médicaments.
+                    Le volume de prescriptions, le profil des patients (âge, comorbidités), ou encore le niveau de surveillance peuvent fortement influencer le nombre de signalements.
+                    Ce graphique constitue néanmoins un outil d’orientation précieux pour identifier les molécules nécessitant une analyse plus approfondie en pharmacovigilance.
+                """, className="text-justify")
+            ])
+        ], className="mb-5"),
+
+        dbc.Row([
+            dbc.Col([
+                html.H4("Déclarations par année", className="mb-3 text-center"),
+                dcc.Graph(id="graph-annees", className="centered-plot"),
+            ])
         ])
-    ])
-], fluid=True)
+    ], fluid=True)
+
+def _enumeration(paires):
+    # [("Pain", 59), ("Rash", 39)] -> "Pain (59 cas) et Rash (39 cas)"
+    elements = [f"{nom} ({n} cas)" for nom, n in paires]
+    return elements[0] if len(elements) == 1 else ", ".join(elements[:-1]) + " et " + elements[-1]
+
+def _commentaires(summary, filtre):
+    # Phrases chiffrées des graphiques, recalculées avec les filtres de la session
+    if not summary["key_figures"]["reports"]:
+        return ("Aucune déclaration ne correspond aux filtres.",) + ("",) * 3
+    portee = "dans la sélection" if filtre else "dans l'ensemble des données"
+
+    sexes = [(s, n) for s, n in summary["sex"] if n]
+    total = sum(n for _, n in sexes)
+    if total:
+        parts = " et ".join(f"{n / total:.0%} de sexe {s} ({n} cas)" for s, n in sexes)
+        sexe = f"Sur les {total} déclarations {portee} dont le sexe est renseigné : {parts}."
+    else:
+        sexe = f"Le sexe n'est renseigné pour aucune déclaration {portee}."
+
+    ages = sorted(((t, n) for t, n in summary["age"] if n), key=lambda p: -p[1])
+    if ages:
+        age = f"Tranches d'âge les plus représentées {portee} : {_enumeration(ages[:2])}."
+        if len(ages) > 2:
+            age += f" La moins représentée est {ages[-1][0]} ans, avec {ages[-1][1]} cas."
+    else:
+        age = f"L'âge n'est renseigné pour aucune déclaration {portee}."
+
+    effets = summary["top_reactions"]
+    effet = f"Effets les plus déclarés {portee} : {_enumeration(effets[:3])}." if effets else ""
+
+    produits = summary["top_products"]
+    produit = ""
+    if produits:
+        produit = f"{produits[0][0]} est le médicament le plus cité {portee}, avec {produits[0][1]} déclarations"
+        produit += f", suivi de {_enumeration(produits[1:3])}." if len(produits) > 1 else "."
+    return sexe, age, effet, produit
+
+@dash.callback(
+    Output("filtres-exploration", "data", allow_duplicate=True),
+    [Input(graphe, "clickData") for graphe in GRAPHES],
+    Input("filtres-reset", "n_clicks"),
+    State("filtres-exploration", "data"),
+    prevent_initial_call=True
+)
+def update_filters(*args):
+    filtres = dict(args[-1] or {})
+    declencheur = dash.ctx.triggered_id
+    if declencheur == "filtres-reset":
+        return {}
+    clic = dash.ctx.triggered[0]["value"]
+    if not clic:
+        return filtres
+    point = clic["points"][0]
+    # Le graphique des produits affiche des noms abrégés : le nom complet est en customdata
+    valeur = point["customdata"][0] if declencheur == "graph-produits" else point["x"]
+    dimension = GRAPHES[declencheur]
+    if filtres.get(dimension) == valeur:
+        filtres.pop(dimension)
+    else:
+        filtres[dimension] = valeur
+    return filtres
+
+@dash.callback(
+    Output("graph-sexe", "figure"),
+    Output("graph-age", "figure"),
+    Output("graph-effets", "figure"),
+    Output("graph-produits", "figure"),
+    Output("graph-annees", "figure"),
+    Output("filtres-actifs", "children"),
+    Output("texte-sexe", "children"),
+    Output("texte-age", "children"),
+    Output("texte-effets", "children"),
+    Output("texte-produits", "children"),
+    Input("filtres-exploration", "data")
+)
+def update_exploration(filtres):
+    # Chaque combinaison de filtres = ET de bitmaps + popcount, sans filtrer de DataFrame
+    filtres = {k: v for k, v in (filtres or {}).items() if k in LIBELLES_FILTRES}
+    summary = filtered_summary(filtres)
+    n = summary["key_figures"]["reports"]
+    if filtres:
+        badges = [dbc.Badge(f"{LIBELLES_FILTRES[k]} : {v}", color="info", className="me-2") for k, v in filtres.items()]
+        actifs = [html.Span(f"{n} déclarations sélectionnées  ", className="me-3")] + badges
+    else:
+        actifs = html.Span(f"Aucun filtre : {n} déclarations")
+    return (
+        sexe_distribution_graph(summary),
+        age_distribution_graph(summary),
+        top_effects_graph(summary),
+        top_products_graph(summary),
+        year_distribution_graph(summary),
+        actifs,
+        *_commentaires(summary, bool(filtres)),
+    )
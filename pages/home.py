@@ -1,61 +1,85 @@
 import dash
-from dash import dcc, html
+from dash import dcc, html, Input, Output, State
 import dash_bootstrap_components as dbc
 from utils.graphs import plot_world_map
+from utils.data_loader import get_store
 
 dash.register_page(__name__, path="/", name="Accueil")
 
-layout = dbc.Container([
-    dbc.Card(
-        dbc.CardBody([
-            html.H2("Bienvenue sur le tableau de bord de pharmacovigilance – PharmaTrace", className="mb-4 text-center"),
-            html.P(
-                "Ce tableau de bord interactif vous permet d'explorer les effets secondaires rapportés pour des milliers de médicaments, à partir de données réelles issues d'OpenFDA "
-                "Utilisez les onglets à gauche pour visualiser la heatmap des réactions et explorer plus en détail les tendances par principe actif, classe thérapeutique, sexe ou tranche d'âge. ",
-                className="mt-4 text-justify"
-            ),
-            html.Div(style={"height": "30px"}),
-            html.Hr(),
-
-            dbc.Row([
-                dbc.Col([
-                    html.Div(
-                        dcc.Graph(
-                            figure=plot_world_map(), 
-                            style={"width": "100%", "height": "450px"},
-                            className="centered-plot"
-                        ),
-                        className="shadow-lg rounded"
-                    )
-                ], width=12),
-            ], className="my-4"),
-
-            html.P(
-                "Cette carte interactive présente une vue mondiale des effets indésirables déclarés, avec des nuances selon la fréquence des événements et les médicaments concernés.",
-                className="mt-4 text-justify"
-            ),
-
-            html.Hr(),
-            html.H3("Chiffres clés", className="mt-5 mb-3 text-center"),
-            html.Div(style={"height": "30px"}),
-            html.Div([
+def _chiffre(n):
+    return f"{n:,}".replace(",", "\u202f")
+
+def layout():
+    # Carte et chiffres clés issus des tables de synthèse du store partagé
+    chiffres = get_store().summary["key_figures"]
+    return dbc.Container([
+        dbc.Card(
+            dbc.CardBody([
+                html.H2("Bienvenue sur le tableau de bord de pharmacovigilance – PharmaTrace", className="mb-4 text-center"),
+                html.P(
+                    "Ce tableau de bord interactif vous permet d'explorer les effets secondaires rapportés pour des milliers de médicaments, à partir de données réelles issues d'OpenFDA "
+                    "Utilisez les onglets à gauche pour visualiser la heatmap des réactions et explorer plus en détail les tendances par principe actif, classe thérapeutique, sexe ou tranche d'âge. ",
+                    className="mt-4 text-justify"
+                ),
+                html.Div(style={"height": "30px"}),
+                html.Hr(),
+
+                dbc.Row([
+                    dbc.Col([
+                        html.Div(
+                            dcc.Graph(
+                                figure=plot_world_map(), 
+                                id="carte-monde",
+                                style={"width": "100%", "height": "450px"},
+                                className="centered-plot"
+                            ),
+                            className="shadow-lg rounded"
+                        )
+                    ], width=12),
+                ], className="my-4"),
+
+                html.P(
+                    "Cette carte interactive présente une vue mondiale des effets indésirables déclarés, avec des nuances selon la fréquence des événements et les médicaments concernés.",
+                    className="mt-4 text-justify"
+                ),
+                html.P(id="carte-filtre", className="text-center"),
+
+                html.Hr(),
+                html.H3("Chiffres clés", className="mt-5 mb-3 text-center"),
+                html.Div(style={"height": "30px"}),
                 html.Div([
                     html.Div([
-                        html.H4("+30", className="text-primary"),
-                        html.P("pays ont signalé des effets secondaires.")
-                    ], className="chiffre-cle"),
+                        html.Div([
+                            html.H4(_chiffre(chiffres["countries"]), className="text-primary"),
+                            html.P("pays ont signalé des effets secondaires.")
+                        ], className="chiffre-cle"),
 
-                    html.Div([
-                        html.H4("+1460", className="text-success"),
-                        html.P("effets secondaires répertoriés.")
-                    ], className="chiffre-cle"),
+                        html.Div([
+                            html.H4(_chiffre(chiffres["reactions"]), className="text-success"),
+                            html.P("effets secondaires répertoriés.")
+                        ], className="chiffre-cle"),
 
-                    html.Div([
-                        html.H4("+2880", className="text-warning"),
-                        html.P("médicaments ou principes actifs liés à au moins un effet secondaire.")
-                    ], className="chiffre-cle"),
-                ], className="chiffres-cles")
-            ])
-        ]), className="shadow-lg"
-    )
-], fluid=True, className="mt-5")
\ No newline at end of file
+                        html.Div([
+                            html.H4(_chiffre(chiffres["products"]), className="text-warning"),
+                            html.P("médicaments ou principes actifs liés à au moins un effet secondaire.")
+                        ], className="chiffre-cle"),
+                    ], className="chiffres-cles")
+                ])
+            ]), className="shadow-lg"
+        )
+    ], fluid=True, className="mt-5")
+
+@dash.callback(
+    Output("filtres-exploration", "data", allow_duplicate=True),
+    Output("carte-filtre", "children"),
+    Input("carte-monde", "clickData"),
+    State("filtres-exploration", "data"),
+    prevent_initial_call=True
+)
+def select_country(clic, filtres):
+    # Un clic sur un pays filtre les graphiques de la page Exploration
+    pays = clic["points"][0]["location"]
+    return dict(filtres or {}, country=pays), [
+        "Pays sélectionné : ", html.B(pays), " – ",
+        dcc.Link("voir l'exploration filtrée", href="/exploration"),
+    ]
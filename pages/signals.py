@@ -0,0 +1,99 @@
+import dash
+from dash import dcc, html, Input, Output, State, dash_table
+from dash.exceptions import PreventUpdate
+import dash_bootstrap_components as dbc
+import plotly.express as px
+from utils.data_loader import get_store
+from utils.search import search_options, search_products
+from utils.signals import METRICS, top_signals
+
+dash.register_page(__name__, path="/signaux", name="Signaux")
+
+COLONNES = [
+    ("product", "Produit"), ("reaction", "Effet secondaire"), ("count", "Cas"), ("expected", "Attendus"),
+    ("prr", "PRR"), ("ror", "ROR"), ("ror025", "ROR IC95 inf."), ("ror975", "ROR IC95 sup."),
+    ("ic", "IC"), ("ic025", "IC025"),
+]
+
+def layout():
+    return dbc.Container([
+        html.H2("Détection de signaux de pharmacovigilance", className="my-5 text-center"),
+        html.P("""
+            Les comptes bruts de la heatmap ne permettent pas de dire qu'un médicament est plus à risque qu'un autre.
+            Cette page compare, pour chaque couple médicament – effet secondaire, la fréquence observée à celle attendue
+            si le médicament et l'effet étaient indépendants : PRR (proportional reporting ratio), ROR (reporting odds ratio)
+            avec son intervalle de confiance à 95 %, et IC (information component, méthode BCPNN).
+            Un signal est généralement considéré lorsque la borne inférieure du ROR dépasse 1 ou que l'IC025 est positif,
+            avec au moins 3 cas rapportés.
+        """, className="text-justify"),
+
+        dbc.Row([
+            dbc.Col([
+                html.Label("Mesure de classement"),
+                dcc.Dropdown(
+                    options=[{"label": libelle, "value": cle} for cle, libelle in METRICS.items()],
+                    value="ror025", clearable=False, id="signaux-mesure"
+                ),
+            ], md=4),
+            dbc.Col([
+                html.Label("Nombre minimal de cas"),
+                dcc.Input(type="number", min=1, step=1, value=3, id="signaux-min", className="form-control"),
+            ], md=2),
+            dbc.Col([
+                html.Label("Médicaments (optionnel)"),
+                dcc.Dropdown(options=[], value=[], multi=True, id="signaux-produits",
+                             placeholder="Tous les médicaments"),
+            ], md=6),
+        ], className="mb-4"),
+
+        dcc.Loading(dcc.Graph(id="signaux-graph", className="centered-plot"), type="default"),
+        html.Div(style={"height": "30px"}),
+        dash_table.DataTable(
+            id="signaux-table",
+            columns=[{"name": nom, "id": cle, "type": "numeric", "format": {"specifier": ".2f"}} if cle not in ("product", "reaction") else {"name": nom, "id": cle} for cle, nom in COLONNES],
+            page_size=20,
+            sort_action="native",
+            style_table={"overflowX": "auto"},
+            style_header={"backgroundColor": "#1e2130", "color": "white"},
+            style_cell={"backgroundColor": "#272b3f", "color": "white", "textAlign": "center", "padding": "5px"}
+        ),
+    ], fluid=True)
+
+@dash.callback(
+    Output("signaux-produits", "options"),
+    Input("signaux-produits", "search_value"),
+    State("signaux-produits", "value")
+)
+def update_signal_options(search_value, selection):
+    if search_value is None:
+        raise PreventUpdate
+    selection = selection or []
+    st = get_store()
+    produits = selection + [p for p in search_products(st, search_value) if p not in selection]
+    return search_options(st, "product_names", produits)
+
+@dash.callback(
+    Output("signaux-graph", "figure"),
+    Output("signaux-table", "data"),
+    Input("signaux-mesure", "value"),
+    Input("signaux-min", "value"),
+    Input("signaux-produits", "value")
+)
+def update_signals(mesure, min_count, produits):
+    table = top_signals(mesure, min_count=min_count or 1, products=produits or None, limit=200)
+
+    top = table.head(20).copy()
+    top["Couple"] = top["product"] + " – " + top["reaction"]
+    fig = px.bar(
+        top.iloc[::-1], x=mesure, y="Couple", orientation="h",
+        labels={mesure: METRICS[mesure], "Couple": ""},
+        hover_data={"count": True, "expected": ":.2f"},
+        height=600,
+    )
+    fig.update_layout(
+        margin=dict(t=20, l=20, r=20, b=20),
+        plot_bgcolor='#1e1e2f',
+        paper_bgcolor='#1e1e2f',
+        font=dict(color='white'),
+    )
+    return fig, table[[cle for cle, _ in COLONNES]].to_dict("records")
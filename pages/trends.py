@@ -0,0 +1,105 @@
+import dash
+from dash import dcc, html, Input, Output, State
+from dash.exceptions import PreventUpdate
+import dash_bootstrap_components as dbc
+import plotly.express as px
+from utils.data_loader import get_store
+from utils.search import search_options, search_terms
+from utils.trends import DIMENSIONS, month_range, trend_table, total_table
+
+dash.register_page(__name__, path="/tendances", name="Tendances")
+
+def layout():
+    premier, dernier = month_range(get_store())
+    annees = list(range(premier.year, dernier.year + 1)) if premier is not None else [0]
+    return dbc.Container([
+        html.H2("Évolution des déclarations dans le temps", className="my-5 text-center"),
+        html.P("""
+            Nombre mensuel de déclarations citant les médicaments, effets secondaires ou pays sélectionnés.
+            Les séries sont lues dans un cube temporel précalculé à l'ingestion : changer de période,
+            même sur plusieurs années, ne nécessite aucun regroupement des déclarations.
+            L'option « part des déclarations » rapporte chaque série au nombre total de déclarations du mois.
+        """, className="text-justify"),
+
+        dbc.Row([
+            dbc.Col([
+                html.Label("Dimension"),
+                dcc.Dropdown(
+                    options=[{"label": libelle, "value": cle} for cle, libelle in DIMENSIONS.items()],
+                    value="product_names", clearable=False, id="tendances-dimension"
+                ),
+            ], md=3),
+            dbc.Col([
+                html.Label("Termes"),
+                dcc.Dropdown(options=[], value=[], multi=True, id="tendances-termes",
+                             placeholder="Rechercher un terme..."),
+            ], md=6),
+            dbc.Col([
+                html.Label("Affichage"),
+                dcc.RadioItems(
+                    options=[{"label": " Nombre", "value": "count"}, {"label": " Part des déclarations", "value": "share"}],
+                    value="count", id="tendances-echelle", inline=True, inputStyle={"margin-left": "10px"}
+                ),
+            ], md=3),
+        ], className="mb-4"),
+
+        dcc.RangeSlider(
+            min=annees[0], max=annees[-1], step=1, value=[annees[0], annees[-1]],
+            marks={a: str(a) for a in annees}, id="tendances-periode"
+        ),
+        html.Div(style={"height": "20px"}),
+        dcc.Loading(dcc.Graph(id="tendances-graph", className="centered-plot"), type="default"),
+    ], fluid=True)
+
+@dash.callback(
+    Output("tendances-termes", "value"),
+    Input("tendances-dimension", "value")
+)
+def reset_terms(dimension):
+    # Trois termes les plus fréquents de la dimension choisie
+    return search_terms(get_store(), dimension, "", limite=3)
+
+@dash.callback(
+    Output("tendances-termes", "options"),
+    Input("tendances-termes", "search_value"),
+    Input("tendances-termes", "value"),
+    State("tendances-dimension", "value")
+)
+def update_trend_options(search_value, selection, dimension):
+    selection = selection or []
+    if search_value is None and not selection:
+        raise PreventUpdate
+    st = get_store()
+    trouves = search_terms(st, dimension, search_value or "")
+    return search_options(st, dimension, selection + [t for t in trouves if t not in selection])
+
+@dash.callback(
+    Output("tendances-graph", "figure"),
+    Input("tendances-dimension", "value"),
+    Input("tendances-termes", "value"),
+    Input("tendances-periode", "value"),
+    Input("tendances-echelle", "value")
+)
+def update_trends(dimension, termes, periode, echelle):
+    termes = termes or []
+    debut, fin = f"{periode[0]}-01-01", f"{periode[1]}-12-31"
+    table = trend_table(dimension, termes, debut, fin)
+    titre = "Nombre de déclarations"
+    if echelle == "share":
+        table = table.div(total_table(debut, fin).replace(0, float("nan")), axis=0).fillna(0) * 100
+        titre = "Part des déclarations du mois (%)"
+
+    longue = table.reset_index().melt(id_vars="month", var_name="Terme", value_name="valeur")
+    fig = px.line(
+        longue, x="month", y="valeur", color="Terme",
+        labels={"month": "Mois", "valeur": titre},
+        height=550,
+    )
+    fig.update_layout(
+        margin=dict(t=20, l=20, r=20, b=20),
+        plot_bgcolor='#1e1e2f',
+        paper_bgcolor='#1e1e2f',
+        font=dict(color='white'),
+        hovermode="x unified",
+    )
+    return fig
@@ -0,0 +1,55 @@
+import io
+import time
+import pandas as pd
+import pytest
+from werkzeug.datastructures import MultiDict
+from utils import export
+
+
+@pytest.fixture(scope="module")
+def client():
+    import app
+    return app.server.test_client()
+
+
+def _attendre(jobs, job_id):
+    for _ in range(100):
+        statut = jobs.status(job_id)
+        if statut and statut["state"] in ("done", "error"):
+            return statut
+        time.sleep(0.05)
+    return statut
+
+
+@pytest.mark.parametrize("valeur", ["2014/01/01", "Jan 1 2014", "01 January 2014"])
+def test_dates_normalisees(valeur):
+    filtres = export.filters_from_args(MultiDict({"from": valeur, "to": "2016/12/31"}))
+    assert filtres["date_range"] == ("2014-01-01", "2016-12-31")
+
+
+def test_date_invalide():
+    with pytest.raises(ValueError):
+        export.filters_from_args(MultiDict({"from": "pas une date"}))
+
+
+def test_route_date_non_iso(client):
+    iso = client.get("/export/effets.csv?from=2014-01-01&to=2016-12-31")
+    r = client.get("/export/effets.csv?from=2014/01/01&to=Dec 31 2016")
+    # Le flux doit aller jusqu'au bout et donner le même fichier qu'avec des dates ISO
+    assert r.status_code == 200
+    assert r.data == iso.data
+    assert len(pd.read_csv(io.BytesIO(r.data))) > 0
+    assert client.get("/export/effets.csv?from=bad").status_code == 400
+
+
+def test_tache_date_non_iso(client, tmp_path, monkeypatch):
+    jobs = export.ExportJobs(str(tmp_path), workers=1)
+    monkeypatch.setattr(export, "jobs", jobs)
+    r = client.post("/export/jobs", data={"format": "csv", "from": "March 2014"})
+    assert r.status_code == 202
+    assert _attendre(jobs, r.json["id"])["state"] == "done"
+    # Appel direct, sans passer par la route : le store accepte aussi la forme non ISO
+    job_id = jobs.submit("csv", date_range=("2014/03/01", None))
+    assert _attendre(jobs, job_id)["state"] == "done"
+    with open(jobs.file(job_id), "rb") as f, open(jobs.file(r.json["id"]), "rb") as g:
+        assert f.read() == g.read()
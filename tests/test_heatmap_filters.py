@@ -0,0 +1,40 @@
+import sys
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope="module")
+def heatmap():
+    # Les pages s'enregistrent auprès de l'application Dash à l'import
+    import app  # noqa: F401
+    return sys.modules["pages.Heatmap"]
+
+
+@pytest.fixture
+def table():
+    return pd.DataFrame({
+        "Produit": ["SUTENT", "SUTENT", "XOLAIR", "XOLAIR"],
+        "Effet secondaire": ["Nausea", "Pain", "Asthma", "Bone pain"],
+        "Nombre de cas": [5, 15, 25, 5],
+    })
+
+
+def test_colonne_comptes_numerique(heatmap):
+    colonnes = {c["id"]: c for c in heatmap.layout()["table-effets"].columns}
+    assert colonnes["Nombre de cas"]["type"] == "numeric"
+
+
+@pytest.mark.parametrize("requete", ["{Nombre de cas} 5", "{Nombre de cas} = 5", "{Nombre de cas} eq 5"])
+def test_saisie_numerique_nue(heatmap, table, requete):
+    # "5" ne doit pas retenir 15 ni 25 comme le ferait un "contains"
+    assert heatmap._filtrer(table, requete)["Nombre de cas"].tolist() == [5, 5]
+
+
+def test_saisie_texte_nue(heatmap, table):
+    resultat = heatmap._filtrer(table, "{Effet secondaire} bone pain")
+    assert resultat["Effet secondaire"].tolist() == ["Bone pain"]
+
+
+def test_clauses_combinees(heatmap, table):
+    resultat = heatmap._filtrer(table, "{Effet secondaire} icontains pain && {Nombre de cas} s> 10")
+    assert resultat["Nombre de cas"].tolist() == [15]
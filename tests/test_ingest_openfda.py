@@ -0,0 +1,107 @@
+import io
+import os
+import csv
+import gzip
+import json
+import zipfile
+import pytest
+from utils import data_loader
+from utils.ingest_openfda import COLUMNS, convert_file, extract_report, ingest, iter_results
+
+RECORDS = [
+    {
+        "safetyreportid": "1",
+        "receivedate": "20150319",
+        "occurcountry": "US",
+        "patient": {
+            "patientonsetage": "33",
+            "patientonsetageunit": "801",
+            "patientsex": "2",
+            "reaction": [{"reactionmeddrapt": "Rash ]"}, {"reactionmeddrapt": "Nausea"}],
+            "drug": [{"medicinalproduct": "ASPIRIN {81 MG}"}, {"medicinalproduct": "HUMIRA"}],
+        },
+    },
+    {
+        "safetyreportid": "2",
+        "receivedate": "20160102",
+        "primarysource": {"reportercountry": "FR"},
+        "patient": {
+            "patientonsetage": "18",
+            "patientonsetageunit": "802",
+            "patientsex": "1",
+            "reaction": [{"reactionmeddrapt": "Pyrexia"}],
+            "drug": [{"medicinalproduct": "SUTENT"}],
+        },
+    },
+    # Sans effet : écartée
+    {"safetyreportid": "3", "receivedate": "20160102", "patient": {"drug": [{"medicinalproduct": "X"}]}},
+]
+
+
+def _document(records, indent=None):
+    # "results" apparaît aussi dans meta, sous forme d'objet
+    return json.dumps({"meta": {"results": {"skip": 0, "total": len(records)}}, "results": records}, indent=indent)
+
+
+@pytest.fixture
+def fichiers(tmp_path):
+    texte = _document(RECORDS, indent=1)
+    chemins = {"json": tmp_path / "a.json", "gz": tmp_path / "b.json.gz", "zip": tmp_path / "c.json.zip"}
+    chemins["json"].write_text(texte, encoding="utf-8")
+    with gzip.open(chemins["gz"], "wt", encoding="utf-8") as f:
+        f.write(texte)
+    with zipfile.ZipFile(chemins["zip"], "w") as archive:
+        archive.writestr("c.json", texte)
+    return chemins
+
+
+@pytest.mark.parametrize("taille_bloc", [1, 7, 64, 1 << 20])
+def test_iter_results_blocs(taille_bloc):
+    # Petits blocs : les déclarations (et la clé "results") sont coupées entre deux lectures
+    texte = _document(RECORDS)
+    assert list(iter_results(io.StringIO(texte), taille_bloc)) == RECORDS
+
+
+def test_iter_results_sans_resultats():
+    assert list(iter_results(io.StringIO('{"meta": {}}'), 8)) == []
+    assert list(iter_results(io.StringIO('{"results": []}'), 8)) == []
+
+
+def test_extract_report():
+    ligne = extract_report(RECORDS[0])
+    assert ligne == {
+        "date": "2015-03-19",
+        "age": 33.0,
+        "age_unit": 801,
+        "sex": "Female",
+        "reactions": repr(["Rash ]", "Nausea"]),
+        "country": "US",
+        "product_names": repr(["ASPIRIN {81 MG}", "HUMIRA"]),
+    }
+    # Âge en mois converti en années, pays du déclarant à défaut du pays de survenue
+    ligne = extract_report(RECORDS[1])
+    assert ligne["age"] == 1.5 and ligne["country"] == "FR" and ligne["sex"] == "Male"
+    assert extract_report(RECORDS[2]) is None
+
+
+@pytest.mark.parametrize("format_", ["json", "gz", "zip"])
+def test_convert_file(fichiers, tmp_path, format_):
+    sortie = tmp_path / f"{format_}.csv"
+    _, lues, ecrites = convert_file(str(fichiers[format_]), str(sortie))
+    assert (lues, ecrites) == (3, 2)
+    with open(sortie, newline="", encoding="utf-8") as f:
+        lignes = list(csv.DictReader(f))
+    assert [l["date"] for l in lignes] == ["2015-03-19", "2016-01-02"]
+
+
+def test_ingest(fichiers, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "CACHE_DIR", str(tmp_path / "cache"))
+    sortie = tmp_path / "df.csv"
+    st = ingest([str(fichiers[f]) for f in ("json", "gz", "zip")], str(sortie), workers=2)
+
+    with open(sortie, encoding="utf-8") as f:
+        assert f.readline().strip() == ",".join(COLUMNS)
+    assert len(st) == 6
+    assert st.summary["countries"] == [["FRA", 3], ["USA", 3]]
+    assert st.vocab("product_names").tolist() == ["ASPIRIN {81 MG}", "HUMIRA", "SUTENT"]
+    assert not [n for n in os.listdir(tmp_path) if n.startswith("openfda-")]
@@ -0,0 +1,29 @@
+import cProfile
+from utils.instrumentation import SlowCallbackProfiler
+
+
+def test_un_seul_profil_actif_par_processus(tmp_path):
+    profiler = SlowCallbackProfiler(1.0, str(tmp_path))
+    premier = profiler.start()
+    assert premier is not None
+    # Requête concurrente : pas de second cProfile, donc pas de ValueError en 3.12+
+    assert profiler.start() is None
+    profiler.stop(premier, "cb", 0.5)
+    assert len(list(tmp_path.glob("*.prof"))) == 1
+    second = profiler.start()
+    assert second is not None
+    profiler.discard(second)
+
+
+def test_autre_profileur_actif(tmp_path, monkeypatch):
+    def refus(self):
+        raise ValueError("Another profiling tool is already active")
+
+    monkeypatch.setattr(cProfile.Profile, "enable", refus)
+    profiler = SlowCallbackProfiler(1.0, str(tmp_path))
+    assert profiler.start() is None
+    monkeypatch.undo()
+    # Le verrou a été rendu : l'appel suivant peut être profilé
+    profil = profiler.start()
+    assert profil is not None
+    profiler.discard(profil)
@@ -0,0 +1,10 @@
+from utils.search import ProductSearchIndex, load_aliases
+
+
+def test_search_text_couvre_les_alias():
+    index = ProductSearchIndex(["HUMIRA", "Aspirin.", "ADALIMUMAB"], [79, 61, 1], load_aliases())
+    assert index.search("adalim") == ["ADALIMUMAB", "HUMIRA"]
+    # Chaque résultat du serveur doit rester visible dans le filtre du navigateur
+    for nom in index.search("adalim"):
+        assert "ADALIM" in index.search_text(nom)
+    assert index.search_text("Aspirin.") == "Aspirin. ASPIRIN"
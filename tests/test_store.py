@@ -0,0 +1,139 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from utils import data_loader, store
+
+LIGNES = [
+    ("2014-04-30", 65.0, 801, "Female", ["Fièvre", "Pain"], "FR", ["DOLIPRANE", "ASPIRIN."]),
+    ("2015-01-02", 30.0, 801, "Male", ["Pain"], "US", ["HUMIRA"]),
+    ("2016-07-14", None, None, None, ["Œdème", "Fièvre"], "JP", ["ÉFFERALGAN", "HUMIRA"]),
+]
+
+
+def _csv(chemin, lignes):
+    colonnes = ["date", "age", "age_unit", "sex", "reactions", "country", "product_names"]
+    pd.DataFrame([dict(zip(colonnes, l)) for l in lignes]).to_csv(chemin, index=False)
+    return str(chemin)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path
+
+
+def test_chaines_utf8():
+    valeurs = ["", "Fièvre", "Œdème", "ASPIRIN."]
+    offsets, octets = store.encode_strings(valeurs)
+    assert octets.dtype == np.uint8 and offsets[-1] == len(octets)
+    assert store.decode_strings(offsets, octets).tolist() == valeurs
+
+
+def test_vocabulaires_sans_largeur_fixe(cache):
+    st = data_loader.build_store(_csv(cache / "df.csv", LIGNES))
+    assert st.vocab("reactions").tolist() == ["Fièvre", "Pain", "Œdème"]
+    assert st["country.labels"].tolist() == ["FRA", "JPN", "USA"]
+    assert st.lists("product_names")[2] == ["HUMIRA", "ÉFFERALGAN"]
+    dossier = os.path.join(st.path, st.version)
+    for nom in os.listdir(dossier):
+        if nom.endswith(".npy"):
+            assert np.load(os.path.join(dossier, nom), mmap_mode="r").dtype.kind != "U", nom
+
+
+LOT = [
+    ("2016-08-01", 40.0, 801, "Female", ["Rash", "Pain"], "FR", ["SUTENT", "HUMIRA"]),
+    ("2013-12-31", 70.0, 801, "Male", ["Vertige"], "Atlantis", ["NOUVEAU"]),
+    ("2017-02-03", 8.0, 801, "Unknown", ["Rash"], "DE", ["SUTENT"]),
+]
+
+
+def _cooccurrences(st):
+    produits, effets = st.vocab("product_names"), st.vocab("reactions")
+    couples = {}
+    for pid, produit in enumerate(produits.tolist()):
+        indices, data = st.cooccurrences(pid)
+        couples.update({(produit, effets[i]): int(n) for i, n in zip(indices.tolist(), data.tolist())})
+    return couples
+
+
+def _par_terme(st, col, valeurs):
+    noms = st.vocab(col) if col != "country" else st["country.labels"]
+    return {nom: tuple(np.asarray(a).tolist() for a in valeurs(i)) for i, nom in enumerate(noms.tolist())}
+
+
+def test_append_identique_au_build(cache):
+    base = _csv(cache / "df.csv", LIGNES)
+    st = data_loader.append_reports(_csv(cache / "lot.csv", LOT), base)
+    ref = data_loader.build_store(_csv(cache / "complet.csv", LIGNES + LOT))
+
+    assert len(st) == len(ref) == 5
+    assert st.meta["country_report"] == ref.meta["country_report"]
+    assert st.meta["country_report"]["unmapped"] == {"Atlantis": 1}
+    assert st.summary == ref.summary
+    # Les nouveaux termes sont ajoutés en fin de vocabulaire : comparaison par nom
+    cadre, attendu = st.to_frame(), ref.to_frame()
+    for col in store.LIST_COLUMNS:
+        assert [sorted(l) for l in cadre.pop(col)] == [sorted(l) for l in attendu.pop(col)]
+    pd.testing.assert_frame_equal(cadre, attendu)
+    assert _cooccurrences(st) == _cooccurrences(ref)
+    for col in store.LIST_COLUMNS + ["country"]:
+        assert _par_terme(st, col, lambda i: (st.postings(col, i),)) == \
+            _par_terme(ref, col, lambda i: (ref.postings(col, i),))
+        assert _par_terme(st, col, lambda i: st.time_series(col, i)) == \
+            _par_terme(ref, col, lambda i: ref.time_series(col, i))
+    assert np.asarray(st["timecube.total"]).tolist() == np.asarray(ref["timecube.total"]).tolist()
+    assert st.rows_between("2014-01-01", "2016-07-31").tolist() == ref.rows_between("2014-01-01", "2016-07-31").tolist()
+    assert store.is_fresh(st.path, base)
+
+
+def _listes(rng, vocab, n, maximum):
+    tailles = rng.integers(1, maximum + 1, n)
+    return [l.tolist() for l in np.split(vocab[rng.integers(0, len(vocab), tailles.sum())], np.cumsum(tailles)[:-1])]
+
+
+def _lot_aleatoire(rng, n):
+    # Vocabulaires fixes : seule la quantité de déclarations varie
+    dates = np.datetime64("2010-01-01") + rng.integers(0, 4000, n)
+    return pd.DataFrame({
+        "date": pd.Series(dates.astype(str)).where(rng.random(n) > 0.01),
+        "age": rng.integers(0, 100, n).astype(float),
+        "age_unit": 801.0,
+        "sex": rng.choice(["Female", "Male"], n),
+        "reactions": _listes(rng, np.array([f"Effet {i}" for i in range(300)]), n, 5),
+        "country": rng.choice(["FRA", "USA", "JPN", "DEU"], n),
+        "product_names": _listes(rng, np.array([f"PRODUIT {i}" for i in range(400)]), n, 3),
+    })
+
+
+def _pic_finish(chemin, n_lots, taille_lot):
+    import tracemalloc
+    rng = np.random.default_rng(0)
+    writer = store.StoreWriter(str(chemin), {})
+    for _ in range(n_lots):
+        writer.append(_lot_aleatoire(rng, taille_lot))
+    tracemalloc.start()
+    try:
+        writer.finish()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_finish_memoire_bornee(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "DERIVE_ROWS", 4_000)
+    monkeypatch.setattr(store, "DERIVE_PAIRS", 20_000)
+    petit = _pic_finish(tmp_path / "petit.store", 2, 5_000)
+    grand = _pic_finish(tmp_path / "grand.store", 8, 5_000)
+    # Quatre fois plus de déclarations, pic mémoire de finish() quasi inchangé
+    assert grand < 1.5 * petit, (petit, grand)
+    st = store.open_store(str(tmp_path / "grand.store"))
+    assert len(st) == 40_000 and st["date.order"].shape == (40_000,)
+
+
+def test_derives_par_blocs(cache):
+    st = data_loader.build_store(_csv(cache / "df.csv", LIGNES + LOT))
+    arrays = {nom: st[nom] for nom in st.names()}
+    # Blocs d'une déclaration et plages d'un couple : mêmes résultats que le build
+    for nom, valeur in store.derived_arrays(arrays, taille_bloc=1, budget=1).items():
+        assert np.array_equal(np.asarray(valeur), np.asarray(st[nom])), nom
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+from .instrumentation import record_rows
+
+
+def product_reaction_counts(st, produits):
+    # Produits sélectionnés x effets : simples tranches de lignes de la matrice de co-occurrence
+    vocab = st.vocab("reactions")
+    tranches = [st.cooccurrences(pid) if pid >= 0 else (np.zeros(0, np.int32), np.zeros(0, np.int32))
+                for pid in st.term_ids("product_names", produits)]
+
+    presents = np.unique(np.concatenate([indices for indices, _ in tranches])) if tranches else np.zeros(0, np.int64)
+    presents = presents[np.argsort(vocab[presents], kind="stable")]
+    position = np.empty(len(vocab), dtype=np.int64)
+    position[presents] = np.arange(len(presents))
+
+    record_rows(sum(len(indices) for indices, _ in tranches))
+    comptes = np.zeros((len(produits), len(presents)), dtype=np.int64)
+    for i, (indices, data) in enumerate(tranches):
+        comptes[i, position[indices]] = data
+    return pd.DataFrame(comptes, index=list(produits), columns=vocab[presents].tolist())
@@ -0,0 +1,182 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from .data_loader import get_store
+from .instrumentation import record_rows
+from .store import age_group_codes
+from .summary import AGE_LABELS, summarize
+
+# Dimensions filtrables : bitmaps denses (une par valeur) ou construites depuis les postings
+DENSE_DIMENSIONS = ["sex", "age", "year"]
+TERM_DIMENSIONS = {"country": "country", "product": "product_names", "reaction": "reactions"}
+FILTER_DIMENSIONS = DENSE_DIMENSIONS + list(TERM_DIMENSIONS)
+
+# Nombre de bits à 1 de chaque octet
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+_index = {}
+_lock = threading.Lock()
+
+
+def popcount(bits, axis=None):
+    return _POPCOUNT[bits].sum(axis=axis, dtype=np.int64)
+
+
+def from_rows(lignes, n):
+    # Numéros de déclarations -> bitmap compactée (1 bit par déclaration)
+    masque = np.zeros(n, dtype=bool)
+    masque[np.asarray(lignes, dtype=np.int64)] = True
+    return np.packbits(masque)
+
+
+def to_rows(bits, n):
+    return np.flatnonzero(np.unpackbits(bits, count=n))
+
+
+def dense_bitmaps(codes, n_valeurs, taille_bloc=1 << 20):
+    """Matrice n_valeurs x ceil(n/8) : ligne i = bitmap des déclarations de code i.
+
+    Construite par blocs de `taille_bloc` déclarations (multiple de 8) ; les codes
+    négatifs (valeur manquante) n'apparaissent dans aucune bitmap.
+    """
+    n = len(codes)
+    matrice = np.zeros((n_valeurs, (n + 7) // 8), dtype=np.uint8)
+    for debut in range(0, n, taille_bloc):
+        bloc = np.asarray(codes[debut:debut + taille_bloc], dtype=np.int64)
+        valides = np.flatnonzero(bloc >= 0)
+        masque = np.zeros((n_valeurs, len(bloc)), dtype=bool)
+        masque[bloc[valides], valides] = True
+        matrice[:, debut // 8:(debut + len(bloc) + 7) // 8] = np.packbits(masque, axis=1)
+    return matrice
+
+
+def year_codes(dates):
+    # Année de chaque déclaration, relative à la première année (-1 si date manquante)
+    annees = np.asarray(dates).astype("datetime64[Y]").astype(np.int64)
+    valides = annees >= 0
+    premiere = int(annees[valides].min()) if valides.any() else 0
+    return np.where(valides, annees - premiere, -1), 1970 + premiere
+
+
+class BitmapIndex:
+    """Index bitmap d'une version du store pour le filtrage croisé.
+
+    Sexe, tranche d'âge et année sont indexés en entier à la construction ; les
+    bitmaps de pays, produits et effets sont construites à la demande depuis les
+    postings et gardées dans un petit cache LRU. Une sélection est le ET des
+    bitmaps des filtres actifs, et un compte est un popcount.
+    """
+
+    def __init__(self, st, taille_cache=64):
+        self.st = st
+        self.n = len(st)
+        annees, premiere = year_codes(st["date"])
+        n_annees = int(annees.max()) + 1 if self.n else 0
+        codes = {
+            "sex": (np.asarray(st["sex.codes"]), len(st["sex.labels"])),
+            "age": (age_group_codes(st["age"]), len(AGE_LABELS)),
+            "year": (annees, n_annees),
+        }
+        self.labels = {
+            "sex": st["sex.labels"].tolist(),
+            "age": list(AGE_LABELS),
+            "year": list(range(premiere, premiere + n_annees)),
+        }
+        self._dense = {dim: dense_bitmaps(c, k) for dim, (c, k) in codes.items()}
+        self._termes = OrderedDict()
+        self._taille_cache = taille_cache
+        self._lock = threading.Lock()
+
+    def bitmap(self, dim, valeur):
+        if dim in self._dense:
+            labels = self.labels[dim]
+            if valeur not in labels:
+                return np.zeros((self.n + 7) // 8, dtype=np.uint8)
+            return self._dense[dim][labels.index(valeur)]
+        if dim not in TERM_DIMENSIONS:
+            raise ValueError(f"Dimension inconnue : {dim}")
+
+        cle = (dim, valeur)
+        with self._lock:
+            if cle in self._termes:
+                self._termes.move_to_end(cle)
+                return self._termes[cle]
+        col = TERM_DIMENSIONS[dim]
+        ids = self.st.category_ids(col, [valeur]) if dim == "country" else self.st.term_ids(col, [valeur])
+        lignes = self.st.postings(col, ids[0]) if ids[0] >= 0 else []
+        bits = from_rows(lignes, self.n)
+        with self._lock:
+            self._termes[cle] = bits
+            while len(self._termes) > self._taille_cache:
+                self._termes.popitem(last=False)
+        return bits
+
+    def select(self, filtres):
+        # ET des bitmaps des filtres renseignés ; None si aucun filtre
+        selection = None
+        for dim in FILTER_DIMENSIONS:
+            valeur = (filtres or {}).get(dim)
+            if valeur is None:
+                continue
+            bits = self.bitmap(dim, valeur)
+            selection = bits if selection is None else selection & bits
+        return selection
+
+    def count(self, selection):
+        return self.n if selection is None else int(popcount(selection))
+
+    def counts(self, dim, selection):
+        """Nombre de déclarations de la sélection pour chaque valeur de `dim`."""
+        if dim in self._dense:
+            matrice = self._dense[dim]
+            return popcount(matrice if selection is None else matrice & selection, axis=1)
+        col = TERM_DIMENSIONS[dim]
+        comptes = self.st.category_counts(col) if dim == "country" else self.st.term_counts(col)
+        if selection is None:
+            return np.asarray(comptes)
+        # Dimensions à forte cardinalité : comptage direct sur les déclarations retenues
+        lignes = to_rows(selection, self.n)
+        if dim == "country":
+            codes = np.asarray(self.st["country.codes"])[lignes]
+        else:
+            codes = self.st.take(col, lignes)
+        return np.bincount(codes[codes >= 0], minlength=len(comptes))
+
+
+def bitmap_index(st=None):
+    st = st or get_store()
+    cle = (st.path, st.version)
+    # Lecture unique : un clear() concurrent ne doit pas provoquer de KeyError
+    index = _index.get(cle)
+    if index is None:
+        with _lock:
+            index = _index.get(cle)
+            if index is None:
+                _index.clear()
+                index = _index[cle] = BitmapIndex(st)
+    return index
+
+
+def filtered_summary(filtres=None, st=None):
+    """Tables de synthèse (format de summary.json) restreintes aux déclarations filtrées.
+
+    `filtres` associe une dimension de FILTER_DIMENSIONS à une valeur ; la table
+    "years" (déclarations par année) est ajoutée.
+    """
+    st = st or get_store()
+    index = bitmap_index(st)
+    selection = index.select(filtres)
+    comptes = {
+        "sex.labels": st["sex.labels"],
+        "sex.counts": index.counts("sex", selection),
+        "age.counts": index.counts("age", selection),
+        "country.labels": st["country.labels"],
+        "country.counts": index.counts("country", selection),
+    }
+    for dim, col in [("product", "product_names"), ("reaction", "reactions")]:
+        comptes[f"{col}.vocab"] = st.vocab(col)
+        comptes[f"{col}.counts"] = index.counts(dim, selection)
+    summary = summarize(comptes, index.count(selection))
+    record_rows(summary["key_figures"]["reports"])
+    summary["years"] = [[annee, int(n)] for annee, n in zip(index.labels["year"], index.counts("year", selection))]
+    return summary
@@ -0,0 +1,157 @@
+import os
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Caches de résultats enregistrés, exposés sur /metrics
+CACHES = {}
+
+
+class ResultCache:
+    """Cache LRU + TTL borné en nombre d'entrées et en octets.
+
+    Avec `disk_dir`, les résultats sont aussi écrits sur disque (pickle) afin que
+    tous les workers gunicorn profitent des calculs des autres ; à chaque écriture,
+    les fichiers expirés sont supprimés, puis les plus anciens au-delà de
+    `max_disk_bytes` (4 × `max_bytes` par défaut).
+    """
+
+    def __init__(self, name, maxsize=64, ttl=3600, max_bytes=64 * 1024 * 1024, disk_dir=None, max_disk_bytes=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes if max_disk_bytes is not None else 4 * max_bytes
+        self._entrees = OrderedDict()
+        self._octets = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        CACHES[name] = self
+
+    def _expire(self, horodatage):
+        return self.ttl is not None and time.time() - horodatage > self.ttl
+
+    def _fichier(self, key):
+        nom = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{self.name}-{nom}.pkl")
+
+    def _lire_disque(self, key):
+        chemin = self._fichier(key)
+        try:
+            if self._expire(os.path.getmtime(chemin)):
+                return None
+            with open(chemin, "rb") as f:
+                contenu = f.read()
+            cle, valeur = pickle.loads(contenu)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return None
+        return (valeur, len(contenu)) if cle == key else None
+
+    def _ecrire_disque(self, key, contenu):
+        os.makedirs(self.disk_dir, exist_ok=True)
+        chemin = self._fichier(key)
+        tmp = f"{chemin}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(contenu)
+            os.replace(tmp, chemin)
+        except OSError:
+            pass
+        self._purger_disque()
+
+    def _purger_disque(self):
+        # Fichiers de ce cache : expirés d'abord, puis les plus anciens au-delà de max_disk_bytes
+        fichiers = []
+        for nom in os.listdir(self.disk_dir):
+            if not (nom.startswith(f"{self.name}-") and nom.endswith(".pkl")):
+                continue
+            chemin = os.path.join(self.disk_dir, nom)
+            try:
+                infos = os.stat(chemin)
+            except OSError:
+                continue
+            if self._expire(infos.st_mtime):
+                self._supprimer(chemin)
+            else:
+                fichiers.append((infos.st_mtime, infos.st_size, chemin))
+        total = sum(taille for _, taille, _ in fichiers)
+        for _, taille, chemin in sorted(fichiers):
+            if total <= self.max_disk_bytes:
+                break
+            self._supprimer(chemin)
+            total -= taille
+
+    def _supprimer(self, chemin):
+        try:
+            os.remove(chemin)
+        except OSError:
+            pass
+
+    def _ajouter(self, key, valeur, taille):
+        with self._lock:
+            if key in self._entrees:
+                self._octets -= self._entrees.pop(key)[2]
+            self._entrees[key] = (valeur, time.time(), taille)
+            self._octets += taille
+            while self._entrees and (len(self._entrees) > self.maxsize or self._octets > self.max_bytes):
+                self._octets -= self._entrees.popitem(last=False)[1][2]
+                self.evictions += 1
+
+    def get_or_compute(self, key, calcul):
+        with self._lock:
+            entree = self._entrees.get(key)
+            if entree is not None and not self._expire(entree[1]):
+                self._entrees.move_to_end(key)
+                self.hits += 1
+                return entree[0]
+        if self.disk_dir:
+            trouve = self._lire_disque(key)
+            if trouve is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._ajouter(key, *trouve)
+                return trouve[0]
+
+        with self._lock:
+            self.misses += 1
+        valeur = calcul()
+        contenu = pickle.dumps((key, valeur), protocol=pickle.HIGHEST_PROTOCOL)
+        if self.disk_dir:
+            self._ecrire_disque(key, contenu)
+        self._ajouter(key, valeur, len(contenu))
+        return valeur
+
+    def clear(self):
+        with self._lock:
+            self._entrees.clear()
+            self._octets = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entrees),
+                "bytes": self._octets,
+            }
+
+
+def render_metrics():
+    # Format texte Prometheus
+    lignes = []
+    for nom, cache in CACHES.items():
+        stats = cache.stats()
+        for champ, valeur in stats.items():
+            lignes.append(f'pharmatrace_cache_{champ}{{cache="{nom}"}} {valeur}')
+        demandes = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        ratio = (stats["hits"] + stats["disk_hits"]) / demandes if demandes else 0.0
+        lignes.append(f'pharmatrace_cache_hit_ratio{{cache="{nom}"}} {ratio:.4f}')
+    return "\n".join(lignes) + "\n"
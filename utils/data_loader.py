@@ -1,27 +1,221 @@
-import pandas as pd
+import os
 import ast
+import logging
+import threading
+from functools import lru_cache
+import numpy as np
+import pandas as pd
 import pycountry
+from . import store
+from .summary import summary_table
+from .instrumentation import timed
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.environ.get("PHARMATRACE_DATA", os.path.join(BASE_DIR, "df_clean.csv"))
+CACHE_DIR = os.environ.get("PHARMATRACE_CACHE_DIR", os.path.join(BASE_DIR, ".cache"))
+
+logger = logging.getLogger(__name__)
+
+# Valeurs rencontrées dans FAERS que pycountry ne reconnaît pas
+COUNTRY_ALIASES = {
+    "UK": "GBR",
+    "EL": "GRC",
+    "RUSSIA": "RUS",
+    "TURKEY": "TUR",
+    "HOLLAND": "NLD",
+    "SWAZILAND": "SWZ",
+    "MACEDONIA": "MKD",
+    "BURMA": "MMR",
+}
 
+# Jeu de données partagé par toutes les pages du processus
+_dataset = {"signature": None, "store": None}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
 def convert_to_iso3(country_name):
+    if not isinstance(country_name, str) or not country_name.strip():
+        return None
+    nom = country_name.strip().upper()
+    if nom in COUNTRY_ALIASES:
+        return COUNTRY_ALIASES[nom]
     try:
-        return pycountry.countries.lookup(country_name).alpha_3
-    except:
+        return pycountry.countries.lookup(nom).alpha_3
+    except LookupError:
         return None
 
-def load_data():
-    df = pd.read_csv("df_clean.csv")
-    df['country'] = df['country'].apply(convert_to_iso3)
+
+def normalize_countries(serie):
+    # Une seule recherche par valeur distincte, puis application vectorisée sur les codes
+    categories = serie.astype("category")
+    distinctes = categories.cat.categories
+    table = np.array([convert_to_iso3(v) for v in distinctes] + [None], dtype=object)
+    codes = categories.cat.codes.to_numpy()
+    iso3 = pd.Series(table[codes], index=serie.index, dtype=object)
+
+    occurrences = np.bincount(codes[codes >= 0], minlength=len(distinctes))
+    rapport = {
+        "unmapped": {str(v): int(n) for v, code, n in zip(distinctes, table, occurrences) if code is None},
+        "missing": int(serie.isna().sum()),
+        "rows_dropped": int(iso3.isna().sum()),
+    }
+    return iso3, rapport
+
+
+def prepare_reports(df):
+    # Pays en ISO-3 (lignes sans pays exploitable retirées) et listes Python décodées
+    df = df.copy()
+    df['country'], rapport = normalize_countries(df['country'])
     df.dropna(subset=['country'], inplace=True)
 
     # Important pour ton application Dash :
     df['reactions'] = df['reactions'].apply(ast.literal_eval)
     df['product_names'] = df['product_names'].apply(ast.literal_eval)
 
+    return df, rapport
+
+
+def _log_country_report(rapport, total):
+    if rapport["rows_dropped"]:
+        logger.warning(
+            "%d déclarations ignorées sur %d (pays manquant : %d, non reconnus : %s)",
+            rapport["rows_dropped"], total, rapport["missing"], rapport["unmapped"] or "aucun",
+        )
+
+
+def read_csv_reports(path):
+    df = pd.read_csv(path)
+    total = len(df)
+    df, rapport = prepare_reports(df)
+    _log_country_report(rapport, total)
+    df.attrs["country_report"] = rapport
     return df
 
 
+def _merge_country_reports(total, r):
+    total["missing"] += r["missing"]
+    total["rows_dropped"] += r["rows_dropped"]
+    for valeur, n in r["unmapped"].items():
+        total["unmapped"][valeur] = total["unmapped"].get(valeur, 0) + n
+    return total
+
+
+def _build_store(path, chemin_store, chunksize):
+    meta = {"source": os.path.abspath(path), "signature": store.source_signature(path), "sha256": store.source_hash(path)}
+    writer = store.StoreWriter(chemin_store, meta)
+    rapport = {"unmapped": {}, "missing": 0, "rows_dropped": 0}
+    total = 0
+    for bloc in pd.read_csv(path, chunksize=chunksize):
+        total += len(bloc)
+        bloc, r = prepare_reports(bloc)
+        _merge_country_reports(rapport, r)
+        writer.append(bloc)
+    _log_country_report(rapport, total)
+    writer.meta["country_report"] = rapport
+    writer.finish()
+
+
+@timed
+def build_store(path=None, chunksize=100_000, force=True):
+    # Étape d'ingestion : CSV nettoyé -> store colonnaire memory-mappable, lu par blocs
+    path = path or DATA_PATH
+    chemin_store = store.store_path(path, CACHE_DIR)
+    with store.store_lock(chemin_store):
+        # Un autre processus a pu construire le store pendant l'attente du verrou
+        if force or not store.is_fresh(chemin_store, path):
+            _build_store(path, chemin_store, chunksize)
+    return store.open_store(chemin_store)
+
+
+@timed
+def load_store(path=None):
+    path = path or DATA_PATH
+    chemin_store = store.store_path(path, CACHE_DIR)
+    if not store.is_fresh(chemin_store, path):
+        return build_store(path, force=False)
+    return store.open_store(chemin_store)
+
+
+def _as_csv_rows(batch):
+    # Listes Python -> représentation texte de df_clean.csv
+    batch = batch[["date", "age", "age_unit", "sex", "reactions", "country", "product_names"]].copy()
+    for col in store.LIST_COLUMNS:
+        batch[col] = batch[col].apply(lambda v: repr(list(v)) if isinstance(v, (list, tuple)) else v)
+    return batch
+
+
+@timed
+def append_reports(batch, path=None):
+    """Ajoute un lot de déclarations (CSV ou DataFrame au format df_clean.csv) sans rebuild.
+
+    Le lot est ajouté au CSV source et une nouvelle version du store est publiée :
+    les agrégats, index et co-occurrences sont mis à jour à partir du seul lot.
+    La publication réécrit néanmoins tous les tableaux de la version et le CSV est
+    relu en entier pour son empreinte (sha256) : le coût d'un ajout croît avec la
+    taille du store, pas avec celle du lot.
+    """
+    path = path or DATA_PATH
+    if isinstance(batch, str):
+        batch = pd.read_csv(batch)
+    batch = _as_csv_rows(batch)
+    chemin_store = store.store_path(path, CACHE_DIR)
+
+    with store.store_lock(chemin_store):
+        if not store.is_fresh(chemin_store, path):
+            _build_store(path, chemin_store, 100_000)
+        st = store.open_store(chemin_store)
+        lot, rapport = prepare_reports(batch)
+        _log_country_report(rapport, len(batch))
+        arrays = store.append_arrays(st, lot)
+
+        # Le CSV doit se terminer par un saut de ligne avant l'ajout
+        with open(path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+        batch.to_csv(path, mode="a", header=False, index=False)
+
+        meta = dict(st.meta, signature=store.source_signature(path), sha256=store.source_hash(path),
+                    n_reports=len(arrays["date"]))
+        meta["country_report"] = _merge_country_reports(meta["country_report"], rapport)
+        store.save_arrays(arrays, chemin_store, meta)
+    return store.open_store(chemin_store)
+
+
+@timed
+def load_data(path=None):
+    return load_store(path).to_frame()
+
+
+def get_store():
+    """Store partagé en lecture seule, rechargé si le fichier source change."""
+    signature = store.source_signature(DATA_PATH)
+    if _dataset["signature"] == signature:
+        return _dataset["store"]
+    with _lock:
+        if _dataset["signature"] != signature:
+            _dataset["store"] = load_store(DATA_PATH)
+            _dataset["signature"] = signature
+    return _dataset["store"]
+
+
+@timed
 def load_country_counts():
-    df = load_data()
-    country_counts = df['country'].value_counts().reset_index()
-    country_counts.columns = ['country', 'count']
-    return country_counts
+    return summary_table(get_store().summary, "countries", ["country", "count"])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Préconstruction du store ou ajout d'un lot de déclarations")
+    parser.add_argument("--append", metavar="CSV", help="lot de nouvelles déclarations au format df_clean.csv")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Préconstruction du store avant le démarrage des workers
+    st = append_reports(args.append) if args.append else build_store()
+    print(f"{len(st)} déclarations écrites dans {st.path}")
+    print(f"Pays : {st.meta['country_report']}")
@@ -0,0 +1,298 @@
+"""Exports au format long (produit, effet, nombre de cas) produits en flux.
+
+Les couples sont lus dans la matrice de co-occurrence par blocs d'environ
+CHUNK_ROWS lignes et encodés au fil de l'eau (CSV, CSV gzip ou Parquet si
+pyarrow est installé) : la mémoire ne dépend pas de la taille de l'export. Avec
+un filtre de date, de pays ou de sexe, la co-occurrence est recalculée sur les
+seules déclarations retenues. Les gros exports passent par `jobs`, qui les
+écrit en arrière-plan dans PHARMATRACE_EXPORT_DIR.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import zlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from .data_loader import CACHE_DIR, get_store
+from .instrumentation import record_rows
+from .query import reports_for
+from .store import cooccurrence_matrix, csr_take, merge_csr
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet optionnel
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# Format -> (type MIME, extension)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "csv.gz": ("application/gzip", "csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+COLUMNS = ["product", "reaction", "count"]
+CHUNK_ROWS = 100_000
+# Déclarations traitées à la fois quand la co-occurrence est recalculée
+REPORT_BLOCK = 500_000
+
+
+def format_available(fmt):
+    return fmt in FORMATS and (fmt != "parquet" or pq is not None)
+
+
+def _jour(date):
+    if date is None:
+        return None
+    try:
+        return pd.Timestamp(date).strftime("%Y-%m-%d")
+    except (ValueError, OverflowError) as e:
+        raise ValueError(f"Date invalide : {date}") from e
+
+
+def filters_from_args(args):
+    """Filtres d'export à partir des paramètres d'une requête (product, country, sex, from, to)."""
+    # Dates normalisées en AAAA-MM-JJ dès la validation : "2014/01/01" ou "March 2014" sont
+    # acceptés ici et doivent l'être aussi par le store, en flux comme en tâche de fond
+    debut, fin = (_jour(args.get(cle) or None) for cle in ("from", "to"))
+    return {
+        "products": args.getlist("product") or None,
+        "countries": args.getlist("country") or None,
+        "sexes": args.getlist("sex") or None,
+        "date_range": (debut, fin) if debut or fin else None,
+    }
+
+
+def _sous_csr(st, col, lignes):
+    longueurs = np.asarray(st[f"{col}.offsets"])[lignes + 1] - np.asarray(st[f"{col}.offsets"])[lignes]
+    offsets = np.zeros(len(lignes) + 1, dtype=np.int64)
+    np.cumsum(longueurs, out=offsets[1:])
+    return offsets, st.take(col, lignes)
+
+
+def filtered_cooccurrences(st, products=None, countries=None, sexes=None, date_range=None):
+    # Matrice CSR produit x effet, recalculée par blocs si un filtre de déclarations est actif
+    if countries is None and sexes is None and date_range is None:
+        return st["cooc.indptr"], st["cooc.indices"], st["cooc.data"]
+    lignes = reports_for(products=products, countries=countries, sexes=sexes, date_range=date_range, st=st)
+    record_rows(len(lignes))
+    n_produits, n_reactions = len(st.vocab("product_names")), len(st.vocab("reactions"))
+    matrice = (np.zeros(n_produits + 1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+    for debut in range(0, len(lignes), REPORT_BLOCK):
+        bloc = lignes[debut:debut + REPORT_BLOCK]
+        p_offsets, p_ids = _sous_csr(st, "product_names", bloc)
+        r_offsets, r_ids = _sous_csr(st, "reactions", bloc)
+        partielle = cooccurrence_matrix(p_offsets, p_ids, r_offsets, r_ids, n_produits, n_reactions)
+        matrice = merge_csr(*matrice, n_produits, partielle)
+    return matrice
+
+
+def export_frames(products=None, countries=None, sexes=None, date_range=None, st=None, chunk_rows=CHUNK_ROWS):
+    """DataFrames successifs (product, reaction, count) d'environ `chunk_rows` lignes.
+
+    Produits dans l'ordre demandé (tous par ordre alphabétique si `products` est
+    None), effets par nombre de cas décroissant.
+    """
+    st = st or get_store()
+    indptr, indices, data = filtered_cooccurrences(st, products, countries, sexes, date_range)
+    indptr = np.asarray(indptr)
+    vocab_produits, vocab_reactions = st.vocab("product_names"), st.vocab("reactions")
+    if products is None:
+        ids = np.argsort(vocab_produits, kind="stable")
+    else:
+        ids = st.term_ids("product_names", products)
+        ids = ids[ids >= 0]
+
+    # Groupes de produits consécutifs totalisant environ `chunk_rows` couples
+    longueurs = indptr[ids + 1] - indptr[ids]
+    coupures = np.searchsorted(np.cumsum(longueurs), np.arange(chunk_rows, longueurs.sum(), chunk_rows), side="left")
+    for groupe in np.split(ids, coupures + 1):
+        n = indptr[groupe + 1] - indptr[groupe]
+        if not n.sum():
+            continue
+        produits = np.repeat(np.arange(len(groupe)), n)
+        reactions = csr_take(indptr, indices, groupe)
+        comptes = csr_take(indptr, data, groupe)
+        ordre = np.lexsort((-comptes, produits))
+        record_rows(len(ordre))
+        yield pd.DataFrame({
+            "product": vocab_produits[groupe[produits[ordre]]],
+            "reaction": vocab_reactions[reactions[ordre]],
+            "count": comptes[ordre].astype(np.int64),
+        }, columns=COLUMNS)
+
+
+def _csv_chunks(frames):
+    entete = True
+    for frame in frames:
+        yield frame.to_csv(index=False, header=entete).encode("utf-8")
+        entete = False
+    if entete:
+        yield (",".join(COLUMNS) + "\n").encode("utf-8")
+
+
+def _gzip_chunks(morceaux):
+    compresseur = zlib.compressobj(wbits=31)  # 31 : en-tête gzip
+    for morceau in morceaux:
+        sortie = compresseur.compress(morceau)
+        if sortie:
+            yield sortie
+    yield compresseur.flush()
+
+
+class _Tampon:
+    # Fichier en écriture seule pour pyarrow : les octets écrits sont récupérés au fil de l'eau
+    def __init__(self):
+        self.morceaux = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, octets):
+        self.morceaux.append(bytes(octets))
+        self.position += len(octets)
+        return len(octets)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vider(self):
+        octets, self.morceaux = b"".join(self.morceaux), []
+        return octets
+
+
+def _parquet_chunks(frames):
+    if pq is None:
+        raise RuntimeError("L'export Parquet nécessite pyarrow")
+    schema = pa.schema([("product", pa.string()), ("reaction", pa.string()), ("count", pa.int64())])
+    tampon = _Tampon()
+    with pq.ParquetWriter(pa.PythonFile(tampon, mode="w"), schema) as writer:
+        for frame in frames:
+            # Un row group par bloc
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            yield tampon.vider()
+    yield tampon.vider()
+
+
+def encode_frames(frames, fmt):
+    if fmt == "csv":
+        return _csv_chunks(frames)
+    if fmt == "csv.gz":
+        return _gzip_chunks(_csv_chunks(frames))
+    if fmt == "parquet":
+        return _parquet_chunks(frames)
+    raise ValueError(f"Format d'export inconnu : {fmt}")
+
+
+def stream_export(fmt, st=None, **filtres):
+    # Octets du fichier exporté, bloc par bloc (corps d'une réponse Flask en flux)
+    if fmt not in FORMATS:
+        raise ValueError(f"Format d'export inconnu : {fmt}")
+    return encode_frames(export_frames(st=st, **filtres), fmt)
+
+
+class ExportJobs:
+    """Exports en arrière-plan : un pool de threads écrit les fichiers dans `directory`.
+
+    Le statut de chaque export est un fichier JSON à côté du résultat, si bien que
+    n'importe quel worker gunicorn peut répondre au suivi et au téléchargement.
+    """
+
+    _ID = re.compile(r"^[0-9a-f]{32}$")
+
+    def __init__(self, directory, workers=2, ttl=86400):
+        self.directory = directory
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+
+    def _chemin(self, job_id, suffixe):
+        return os.path.join(self.directory, f"{job_id}.{suffixe}")
+
+    def _ecrire_statut(self, job_id, statut):
+        tmp = self._chemin(job_id, f"json.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(statut, f)
+        os.replace(tmp, self._chemin(job_id, "json"))
+
+    def status(self, job_id):
+        if not self._ID.match(str(job_id)):
+            return None
+        try:
+            with open(self._chemin(job_id, "json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def file(self, job_id):
+        # Chemin du fichier produit, None tant que l'export n'est pas terminé
+        statut = self.status(job_id)
+        if not statut or statut["state"] != "done":
+            return None
+        return self._chemin(job_id, FORMATS[statut["format"]][1])
+
+    def _purger(self):
+        limite = time.time() - self.ttl
+        for nom in os.listdir(self.directory):
+            chemin = os.path.join(self.directory, nom)
+            try:
+                if os.path.getmtime(chemin) < limite:
+                    os.remove(chemin)
+            except OSError:
+                pass
+
+    def submit(self, fmt, **filtres):
+        if not format_available(fmt):
+            raise ValueError(f"Format d'export indisponible : {fmt}")
+        os.makedirs(self.directory, exist_ok=True)
+        self._purger()
+        job_id = uuid.uuid4().hex
+        statut = {"id": job_id, "format": fmt, "state": "pending", "rows": 0, "bytes": 0, "error": None,
+                  "created": time.time()}
+        self._ecrire_statut(job_id, statut)
+        self._pool.submit(self._run, statut, filtres)
+        return job_id
+
+    def _run(self, statut, filtres):
+        job_id = statut["id"]
+        sortie = self._chemin(job_id, FORMATS[statut["format"]][1])
+        tmp = f"{sortie}.tmp"
+        statut["state"] = "running"
+        self._ecrire_statut(job_id, statut)
+
+        def suivi(frames):
+            for frame in frames:
+                statut["rows"] += len(frame)
+                self._ecrire_statut(job_id, statut)
+                yield frame
+
+        try:
+            with open(tmp, "wb") as f:
+                for morceau in encode_frames(suivi(export_frames(**filtres)), statut["format"]):
+                    f.write(morceau)
+                    statut["bytes"] += len(morceau)
+            os.replace(tmp, sortie)
+            statut["state"] = "done"
+        except Exception as e:
+            logger.exception("Échec de l'export %s", job_id)
+            statut.update(state="error", error=str(e))
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        statut["finished"] = time.time()
+        self._ecrire_statut(job_id, statut)
+
+
+jobs = ExportJobs(
+    os.environ.get("PHARMATRACE_EXPORT_DIR", os.path.join(CACHE_DIR, "exports")),
+    workers=int(os.environ.get("PHARMATRACE_EXPORT_WORKERS", "2")),
+    ttl=int(os.environ.get("PHARMATRACE_EXPORT_TTL", "86400")),
+)
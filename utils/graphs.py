@@ -1,11 +1,10 @@
 import plotly.express as px
-import pandas as pd
 import numpy as np
 from .data_loader import load_country_counts
+from .summary import summary_table
 
-def sexe_distribution_graph(df):
-    df_gender = df['sex'].value_counts().reset_index()
-    df_gender.columns = ['Sexe', 'Nombre de cas']
+def sexe_distribution_graph(summary):
+    df_gender = summary_table(summary, 'sex', ['Sexe', 'Nombre de cas'])
 
     fig = px.bar(
         df_gender,
@@ -21,13 +20,8 @@ def sexe_distribution_graph(df):
     )
     return fig
 
-def age_distribution_graph(df):
-    bins = [0, 18, 35, 50, 65, 80, 100]
-    labels = ['0-18', '19-35', '36-50', '51-65', '66-80', '81-100']
-    df['age_group'] = pd.cut(df['age'], bins=bins, labels=labels, right=False)
-
-    df_age = df['age_group'].value_counts().sort_index().reset_index()
-    df_age.columns = ['Tranche d\'âge', 'Nombre de cas']
+def age_distribution_graph(summary):
+    df_age = summary_table(summary, 'age', ['Tranche d\'âge', 'Nombre de cas'])
 
     fig = px.bar(
         df_age,
@@ -41,10 +35,8 @@ def age_distribution_graph(df):
     )
     return fig
 
-def top_effects_graph(df):
-    df_effects = df.explode('reactions')
-    top_effects = df_effects['reactions'].value_counts().nlargest(10).reset_index()
-    top_effects.columns = ['Reaction', 'Nombre de cas']
+def top_effects_graph(summary):
+    top_effects = summary_table(summary, 'top_reactions', ['Reaction', 'Nombre de cas'])
 
     fig = px.bar(
         top_effects,
@@ -54,10 +46,8 @@ def top_effects_graph(df):
     fig.update_layout(xaxis_tickangle=-45, plot_bgcolor='#1e1e2f', paper_bgcolor='#1e1e2f')
     return fig
 
-def top_products_graph(df):
-    df_products = df.explode('product_names')
-    top_products = df_products['product_names'].value_counts().nlargest(10).reset_index()
-    top_products.columns = ['Produit', 'Nombre de cas']
+def top_products_graph(summary):
+    top_products = summary_table(summary, 'top_products', ['Produit', 'Nombre de cas'])
 
     rename_dict = {
         'TETANUS (TETANUS VACCINE)': 'Tetanus',
@@ -72,6 +62,7 @@ def top_products_graph(df):
     fig = px.bar(
         top_products,
         x='Produit court', y='Nombre de cas', color='Produit court',
+        custom_data=['Produit'],
         height=450, 
     )
     fig.update_layout(
@@ -84,6 +75,23 @@ def top_products_graph(df):
     )
     return fig
 
+def year_distribution_graph(summary):
+    df_years = summary_table(summary, 'years', ['Année', 'Nombre de cas'])
+
+    fig = px.bar(
+        df_years,
+        x='Année', y='Nombre de cas', text='Nombre de cas',
+        color_discrete_sequence=['#4ECDC4'],
+        height=400,
+    )
+    fig.update_traces(textposition='outside')
+    fig.update_layout(
+        title=None,
+        xaxis={'dtick': 1},
+        plot_bgcolor='#1e1e2f', paper_bgcolor='#1e1e2f'
+    )
+    return fig
+
 def plot_world_map():
     country_counts = load_country_counts()
     country_counts['log_count'] = np.log1p(country_counts['count'])
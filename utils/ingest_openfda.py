@@ -0,0 +1,176 @@
+"""Ingestion hors ligne des fichiers bulk openFDA `drug/event`.
+
+Les fichiers (.json, .json.gz ou .json.zip) sont lus en flux, déclaration par
+déclaration, sans jamais charger le JSON complet en mémoire. Chaque fichier est
+traité par un processus du pool et écrit un CSV partiel au format de
+`df_clean.csv` ; les parties sont ensuite concaténées puis le store colonnaire
+est construit par blocs.
+
+    python -m utils.ingest_openfda drug-event-0001-of-0030.json.zip ... --output df_clean.csv
+"""
+import io
+import os
+import re
+import csv
+import gzip
+import json
+import shutil
+import logging
+import zipfile
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ["date", "age", "age_unit", "sex", "reactions", "country", "product_names"]
+SEXES = {"1": "Male", "2": "Female"}
+# Unités d'âge FAERS -> facteur de conversion en années (801)
+AGE_UNITS = {"800": 10.0, "801": 1.0, "802": 1 / 12, "803": 1 / 52, "804": 1 / 365, "805": 1 / 8760}
+
+_DEBUT_RESULTATS = re.compile(r'"results"\s*:\s*\[')
+_BLANCS = " \t\r\n,"
+
+
+def _open_text(path):
+    if path.endswith(".zip"):
+        archive = zipfile.ZipFile(path)
+        membre = next(n for n in archive.namelist() if n.endswith(".json"))
+        return io.TextIOWrapper(archive.open(membre), encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_results(flux, taille_bloc=1 << 20):
+    # Parcours incrémental du tableau "results" d'un fichier openFDA
+    decodeur = json.JSONDecoder()
+    tampon = ""
+    while True:
+        trouve = _DEBUT_RESULTATS.search(tampon)
+        if trouve:
+            tampon = tampon[trouve.end():]
+            break
+        bloc = flux.read(taille_bloc)
+        if not bloc:
+            return
+        # On garde la fin du tampon au cas où la clé serait coupée entre deux blocs
+        tampon = tampon[-64:] + bloc
+
+    pos = 0
+    while True:
+        while pos < len(tampon) and tampon[pos] in _BLANCS:
+            pos += 1
+        if pos >= len(tampon):
+            bloc = flux.read(taille_bloc)
+            if not bloc:
+                return
+            tampon, pos = tampon[pos:] + bloc, 0
+            continue
+        if tampon[pos] == "]":
+            return
+        try:
+            objet, fin = decodeur.raw_decode(tampon, pos)
+        except json.JSONDecodeError:
+            bloc = flux.read(taille_bloc)
+            if not bloc:
+                raise
+            tampon, pos = tampon[pos:] + bloc, 0
+            continue
+        yield objet
+        pos = fin
+        if pos > taille_bloc:
+            tampon, pos = tampon[pos:], 0
+
+
+def _age_en_annees(age, unite):
+    try:
+        age = float(age)
+    except (TypeError, ValueError):
+        return None, None
+    facteur = AGE_UNITS.get(str(unite))
+    if facteur is None:
+        return None, None
+    return round(age * facteur, 2), 801
+
+
+def extract_report(record):
+    # Champs attendus par load_data() ; None si la déclaration est inexploitable
+    patient = record.get("patient") or {}
+    reactions = [r["reactionmeddrapt"] for r in patient.get("reaction") or [] if r.get("reactionmeddrapt")]
+    produits = [d["medicinalproduct"] for d in patient.get("drug") or [] if d.get("medicinalproduct")]
+    date = record.get("receivedate") or ""
+    if not reactions or not produits or len(date) != 8:
+        return None
+    age, unite = _age_en_annees(patient.get("patientonsetage"), patient.get("patientonsetageunit"))
+    pays = record.get("occurcountry") or (record.get("primarysource") or {}).get("reportercountry")
+    return {
+        "date": f"{date[:4]}-{date[4:6]}-{date[6:]}",
+        "age": age,
+        "age_unit": unite,
+        "sex": SEXES.get(str(patient.get("patientsex"))),
+        "reactions": repr(reactions),
+        "country": pays,
+        "product_names": repr(produits),
+    }
+
+
+def convert_file(path, sortie):
+    # Un fichier openFDA -> un CSV partiel, écrit au fil de l'eau
+    lues = ecrites = 0
+    with _open_text(path) as flux, open(sortie, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        for record in iter_results(flux):
+            lues += 1
+            ligne = extract_report(record)
+            if ligne is not None:
+                writer.writerow(ligne)
+                ecrites += 1
+    return path, lues, ecrites
+
+
+def ingest(fichiers, output, workers=None, build=True):
+    from .data_loader import build_store
+
+    dossier = tempfile.mkdtemp(prefix="openfda-", dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        parties = [os.path.join(dossier, f"part-{i:05d}.csv") for i in range(len(fichiers))]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, lues, ecrites in pool.map(convert_file, fichiers, parties):
+                logger.info("%s : %d déclarations lues, %d retenues", path, lues, ecrites)
+
+        # Concaténation en flux des parties, dans l'ordre des fichiers d'entrée
+        tmp = os.path.join(dossier, "combined.csv")
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            f.write(",".join(COLUMNS) + "\n")
+            for partie in parties:
+                with open(partie, encoding="utf-8") as p:
+                    p.readline()
+                    shutil.copyfileobj(p, f)
+        os.replace(tmp, output)
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+    if build:
+        return build_store(output)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestion des fichiers bulk openFDA drug/event")
+    parser.add_argument("fichiers", nargs="+", help="fichiers .json, .json.gz ou .json.zip")
+    parser.add_argument("--output", default=None, help="CSV produit (par défaut le jeu de données de l'application)")
+    parser.add_argument("--workers", type=int, default=None, help="nombre de processus")
+    parser.add_argument("--no-store", action="store_true", help="ne pas construire le store colonnaire")
+    args = parser.parse_args(argv)
+
+    from .data_loader import DATA_PATH
+    logging.basicConfig(level=logging.INFO)
+    st = ingest(args.fichiers, args.output or DATA_PATH, workers=args.workers, build=not args.no_store)
+    if st is not None:
+        print(f"{len(st)} déclarations écrites dans {st.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Instrumentation des callbacks Dash et des chargements de données, exposée sur /metrics.
+
+Chaque requête `/_dash-update-component` est mesurée côté Flask (durée, taille de
+la réponse sérialisée, lignes lues via `record_rows`), ce qui couvre tous les
+callbacks, y compris ceux des pages, sans les modifier. Avec
+PHARMATRACE_PROFILE_SAMPLE (fraction des appels, ex. 0.05), les appels tirés sont
+profilés par cProfile et les PHARMATRACE_PROFILE_KEEP plus lents sont gardés dans
+PHARMATRACE_PROFILE_DIR (fichiers .prof à ouvrir avec pstats ou snakeviz).
+"""
+import os
+import time
+import random
+import logging
+import cProfile
+import threading
+import functools
+from flask import request
+from .cache import render_metrics as render_cache_metrics
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+SIZE_BUCKETS = [1e3, 1e4, 1e5, 1e6, 1e7, 1e8]
+ROW_BUCKETS = [10, 100, 1e3, 1e4, 1e5, 1e6, 1e7]
+CALLBACK_PATH = "/_dash-update-component"
+
+# Compteurs de la requête en cours (un thread par requête)
+_local = threading.local()
+
+# cProfile n'admet qu'un profileur actif par processus (ValueError à partir de 3.12)
+_profilage = threading.Lock()
+
+
+def _echapper(valeur):
+    return str(valeur).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Histogramme cumulatif au format Prometheus, avec un seul label."""
+
+    def __init__(self, name, description, buckets, label):
+        self.name = name
+        self.description = description
+        self.buckets = list(buckets)
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, valeur, cle):
+        with self._lock:
+            serie = self._series.setdefault(cle, [[0] * len(self.buckets), 0.0, 0])
+            for i, borne in enumerate(self.buckets):
+                if valeur <= borne:
+                    serie[0][i] += 1
+            serie[1] += valeur
+            serie[2] += 1
+
+    def render(self):
+        lignes = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {cle: (list(b), s, n) for cle, (b, s, n) in self._series.items()}
+        for cle, (comptes, somme, total) in sorted(series.items()):
+            label = f'{self.label}="{_echapper(cle)}"'
+            for borne, n in zip(self.buckets, comptes):
+                lignes.append(f'{self.name}_bucket{{{label},le="{borne:g}"}} {n}')
+            lignes.append(f'{self.name}_bucket{{{label},le="+Inf"}} {total}')
+            lignes.append(f"{self.name}_sum{{{label}}} {somme}")
+            lignes.append(f"{self.name}_count{{{label}}} {total}")
+        return lignes
+
+
+CALLBACK_LATENCY = Histogram(
+    "pharmatrace_callback_duration_seconds", "Durée des callbacks Dash, sérialisation comprise.",
+    LATENCY_BUCKETS, "callback")
+CALLBACK_RESPONSE = Histogram(
+    "pharmatrace_callback_response_bytes", "Taille de la réponse JSON des callbacks Dash.",
+    SIZE_BUCKETS, "callback")
+CALLBACK_ROWS = Histogram(
+    "pharmatrace_callback_rows", "Lignes lues dans le store (déclarations ou entrées de matrice) par callback.",
+    ROW_BUCKETS, "callback")
+LOADER_LATENCY = Histogram(
+    "pharmatrace_loader_duration_seconds", "Durée des fonctions de chargement de données.",
+    LATENCY_BUCKETS, "function")
+HISTOGRAMS = [CALLBACK_LATENCY, CALLBACK_RESPONSE, CALLBACK_ROWS, LOADER_LATENCY]
+
+
+def record_rows(n):
+    # Ajoute `n` lignes lues au compteur de la requête en cours (sans effet hors requête)
+    if getattr(_local, "rows", None) is not None:
+        _local.rows += int(n)
+
+
+def timed(fonction):
+    """Décorateur : durée de chaque appel dans pharmatrace_loader_duration_seconds."""
+    @functools.wraps(fonction)
+    def wrapper(*args, **kwargs):
+        debut = time.perf_counter()
+        try:
+            return fonction(*args, **kwargs)
+        finally:
+            LOADER_LATENCY.observe(time.perf_counter() - debut, fonction.__name__)
+    return wrapper
+
+
+class SlowCallbackProfiler:
+    """Profilage cProfile d'une fraction des appels ; seuls les `keep` plus lents sont conservés."""
+
+    def __init__(self, sample_rate, directory, keep=20):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.keep = keep
+        self._gardes = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        # Un seul appel profilé à la fois : les requêtes concurrentes ne sont pas tirées
+        if random.random() >= self.sample_rate or not _profilage.acquire(blocking=False):
+            return None
+        profil = cProfile.Profile()
+        try:
+            profil.enable()
+        except ValueError:
+            # Autre outil de profilage actif (débogueur, py-spy…) : appel non profilé
+            _profilage.release()
+            return None
+        return profil
+
+    def discard(self, profil):
+        try:
+            profil.disable()
+        finally:
+            _profilage.release()
+
+    def stop(self, profil, callback, duree):
+        self.discard(profil)
+        with self._lock:
+            if len(self._gardes) >= self.keep and duree <= self._gardes[0][0]:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            nom = "".join(c if c.isalnum() or c in "-_." else "_" for c in callback).strip("._")[:80]
+            chemin = os.path.join(self.directory, f"{duree * 1000:09.1f}ms-{nom}-{int(time.time())}.prof")
+            profil.dump_stats(chemin)
+            self._gardes.append((duree, chemin))
+            self._gardes.sort()
+            while len(self._gardes) > self.keep:
+                _, ancien = self._gardes.pop(0)
+                try:
+                    os.remove(ancien)
+                except OSError:
+                    pass
+        logger.info("Profil de %s (%.3f s) écrit dans %s", callback, duree, chemin)
+
+
+def _profiler_from_env():
+    taux = float(os.environ.get("PHARMATRACE_PROFILE_SAMPLE", "0") or 0)
+    if taux <= 0:
+        return None
+    dossier = os.environ.get("PHARMATRACE_PROFILE_DIR", os.path.join(os.getcwd(), ".cache", "profiles"))
+    return SlowCallbackProfiler(taux, dossier, int(os.environ.get("PHARMATRACE_PROFILE_KEEP", "20")))
+
+
+def _callback_name():
+    # Identifiant des sorties du callback, sans le suffixe @hash des sorties dupliquées
+    corps = request.get_json(silent=True) or {}
+    sortie = str(corps.get("output", "inconnu"))
+    return ".".join(partie.split("@")[0] for partie in sortie.split("."))
+
+
+def instrument_server(server, profiler=None):
+    """Branche la mesure des callbacks Dash sur le serveur Flask de l'application."""
+    profiler = profiler or _profiler_from_env()
+
+    @server.before_request
+    def _debut_callback():
+        if request.path.endswith(CALLBACK_PATH):
+            _local.rows = 0
+            _local.debut = time.perf_counter()
+            _local.profil = profiler.start() if profiler else None
+
+    @server.after_request
+    def _fin_callback(response):
+        if request.path.endswith(CALLBACK_PATH) and getattr(_local, "debut", None) is not None:
+            duree = time.perf_counter() - _local.debut
+            callback = _callback_name()
+            CALLBACK_LATENCY.observe(duree, callback)
+            CALLBACK_RESPONSE.observe(response.calculate_content_length() or 0, callback)
+            CALLBACK_ROWS.observe(_local.rows, callback)
+            if _local.profil is not None:
+                profil, _local.profil = _local.profil, None
+                profiler.stop(profil, callback, duree)
+        return response
+
+    @server.teardown_request
+    def _nettoyage(_exc):
+        profil = getattr(_local, "profil", None)
+        if profil is not None:
+            profiler.discard(profil)
+        _local.rows = _local.debut = _local.profil = None
+
+    return server
+
+
+def render_metrics():
+    # Histogrammes des callbacks et des chargements, puis compteurs des caches
+    lignes = []
+    for histogramme in HISTOGRAMS:
+        lignes += histogramme.render()
+    return "\n".join(lignes) + "\n" + render_cache_metrics()
@@ -0,0 +1,45 @@
+import numpy as np
+from .data_loader import get_store
+from .instrumentation import record_rows
+
+
+def _union(st, col, ids):
+    listes = [st.postings(col, i) for i in ids if i >= 0]
+    if not listes:
+        return np.zeros(0, dtype=np.int64)
+    if len(listes) == 1:
+        return np.asarray(listes[0])
+    return np.unique(np.concatenate(listes))
+
+
+def reports_for(products=None, reactions=None, countries=None, sexes=None, date_range=None, st=None):
+    """Numéros de déclarations triés correspondant aux filtres.
+
+    Union des listes de postings à l'intérieur d'un filtre (au moins un des produits),
+    intersection entre filtres. Un filtre à None n'est pas appliqué ; `date_range` est
+    un couple (début, fin) inclusif dont chaque borne peut être None.
+    """
+    st = st or get_store()
+    resultat = None
+    filtres = [
+        ("product_names", products, lambda t: st.term_ids("product_names", t)),
+        ("reactions", reactions, lambda t: st.term_ids("reactions", t)),
+        ("country", countries, lambda t: st.category_ids("country", t)),
+    ]
+    for col, termes, vers_ids in filtres:
+        if termes is None:
+            continue
+        lignes = _union(st, col, vers_ids(termes))
+        resultat = lignes if resultat is None else np.intersect1d(resultat, lignes, assume_unique=True)
+    if sexes is not None:
+        codes = np.asarray(st["sex.codes"])
+        ids = st.category_ids("sex", sexes)
+        lignes = np.flatnonzero(np.isin(codes, ids[ids >= 0]))
+        resultat = lignes if resultat is None else np.intersect1d(resultat, lignes, assume_unique=True)
+    if date_range is not None:
+        lignes = st.rows_between(*date_range)
+        resultat = lignes if resultat is None else np.intersect1d(resultat, lignes, assume_unique=True)
+    if resultat is None:
+        resultat = np.arange(len(st), dtype=np.int64)
+    record_rows(len(resultat))
+    return resultat
@@ -0,0 +1,248 @@
+import os
+import re
+import csv
+import bisect
+import threading
+import unicodedata
+import numpy as np
+
+_NON_ALPHANUM = re.compile(r"[^A-Z0-9]+")
+
+# Index de recherche par version du store
+_index = {}
+_lock = threading.Lock()
+
+
+def normalize(nom):
+    # Majuscules, sans accents ni ponctuation : "Aspirin." et "ASPIRIN" se confondent
+    nom = unicodedata.normalize("NFKD", str(nom)).encode("ascii", "ignore").decode("ascii")
+    return _NON_ALPHANUM.sub(" ", nom.upper()).strip()
+
+
+def _trigrammes(texte):
+    return {texte[i:i + 3] for i in range(len(texte) - 2)}
+
+
+# Noms de marque -> dénomination commune : la recherche de l'un trouve aussi l'autre.
+# Table complétée par le CSV (colonnes brand,generic) désigné par PHARMATRACE_PRODUCT_ALIASES.
+BRAND_GENERICS = {
+    "SUTENT": "SUNITINIB",
+    "HUMIRA": "ADALIMUMAB",
+    "XOLAIR": "OMALIZUMAB",
+    "ENBREL": "ETANERCEPT",
+    "REVLIMID": "LENALIDOMIDE",
+    "SOLIRIS": "ECULIZUMAB",
+    "REMICADE": "INFLIXIMAB",
+    "KEYTRUDA": "PEMBROLIZUMAB",
+    "OPDIVO": "NIVOLUMAB",
+    "GLEEVEC": "IMATINIB",
+    "TYLENOL": "ACETAMINOPHEN",
+    "DOLIPRANE": "PARACETAMOL",
+    "DECADRON": "DEXAMETHASONE",
+    "PRILOSEC": "OMEPRAZOLE",
+    "NEXIUM": "ESOMEPRAZOLE",
+    "LIPITOR": "ATORVASTATIN",
+    "CRESTOR": "ROSUVASTATIN",
+    "ZOCOR": "SIMVASTATIN",
+    "COUMADIN": "WARFARIN",
+    "XARELTO": "RIVAROXABAN",
+    "ELIQUIS": "APIXABAN",
+    "GLUCOPHAGE": "METFORMIN",
+    "LASIX": "FUROSEMIDE",
+    "SYNTHROID": "LEVOTHYROXINE",
+    "ADVIL": "IBUPROFEN",
+    "MOTRIN": "IBUPROFEN",
+    "PROAIR": "ALBUTEROL",
+    "VENTOLIN": "SALBUTAMOL",
+    "ZOLOFT": "SERTRALINE",
+    "PROZAC": "FLUOXETINE",
+    "NEURONTIN": "GABAPENTIN",
+    "LYRICA": "PREGABALIN",
+}
+
+
+def load_aliases(path=None):
+    """Mot normalisé -> mots équivalents (marque <-> premier mot du générique), dans les deux sens."""
+    paires = list(BRAND_GENERICS.items())
+    path = path or os.environ.get("PHARMATRACE_PRODUCT_ALIASES")
+    if path:
+        with open(path, newline="", encoding="utf-8") as f:
+            paires += [(ligne["brand"], ligne["generic"]) for ligne in csv.DictReader(f)]
+    alias = {}
+    for marque, generique in paires:
+        marque, generique = normalize(marque), normalize(generique)
+        if not marque or not generique:
+            continue
+        for mot in marque.split():
+            alias.setdefault(mot, set()).update(generique.split())
+        alias.setdefault(generique.split()[0], set()).update(marque.split())
+    return alias
+
+
+class ProductSearchIndex:
+    """Recherche de produits par préfixe de mot et par trigrammes, classée par nombre de déclarations.
+
+    Les noms sont normalisés, si bien que la casse, la ponctuation et les variantes
+    d'écriture (« ASPIRIN. », « CALCIUM+ VIT D ») sont trouvées ensemble ; le contenu
+    entre parenthèses (souvent le générique d'un nom de marque) est indexé aussi, ainsi
+    que les équivalents marque/générique de `aliases`.
+
+    Trois classes de résultats, dans l'ordre : le nom commence par la requête, chaque
+    mot de la requête préfixe un mot du nom, la requête est une sous-chaîne du nom.
+    Chaque classe est classée en NumPy et la recherche s'arrête dès `limite` résultats.
+    """
+
+    def __init__(self, noms, comptes, aliases=None):
+        self.noms = list(noms)
+        self.comptes = np.asarray(comptes, dtype=np.int64)
+        self.normalises = [normalize(n) for n in self.noms]
+        aliases = load_aliases() if aliases is None else aliases
+        self._aliases = aliases
+
+        # Rang alphabétique : départage des noms de même nombre de déclarations
+        self._rang_nom = np.empty(len(self.noms), dtype=np.int64)
+        self._rang_nom[np.argsort(np.array(self.noms, dtype=object), kind="stable")] = np.arange(len(self.noms))
+
+        tri = sorted(range(len(self.normalises)), key=self.normalises.__getitem__)
+        self._tri = [self.normalises[i] for i in tri]
+        self._ids_tri = np.array(tri, dtype=np.int64)
+
+        paires = []
+        for i, nom in enumerate(self.normalises):
+            mots = set(nom.split())
+            for mot in list(mots):
+                mots |= aliases.get(mot, set())
+            paires += [(mot, i) for mot in mots]
+        paires.sort()
+        self._mots = [mot for mot, _ in paires]
+        self._ids_mots = np.array([i for _, i in paires], dtype=np.int64)
+
+        postings = {}
+        for i, nom in enumerate(self.normalises):
+            for tri in _trigrammes(nom):
+                postings.setdefault(tri, []).append(i)
+        self._trigrammes = {tri: np.array(ids, dtype=np.int64) for tri, ids in postings.items()}
+        self._par_popularite = np.lexsort((self._rang_nom, -self.comptes))
+
+    def _plage(self, liste, debut):
+        return bisect.bisect_left(liste, debut), bisect.bisect_left(liste, debut + "\x7f")
+
+    def _prefixe(self, mot):
+        debut, fin = self._plage(self._mots, mot)
+        return self._ids_mots[debut:fin]
+
+    def _classer(self, ids):
+        # Nombre de déclarations décroissant, puis ordre alphabétique
+        return ids[np.lexsort((self._rang_nom[ids], -self.comptes[ids]))]
+
+    def _masque(self, ids):
+        # Ensemble d'ids sous forme de masque : évite les tris de np.unique / np.setdiff1d
+        masque = np.zeros(len(self.noms), dtype=bool)
+        masque[ids] = True
+        return masque
+
+    def _meilleurs(self, ids, exclus, n):
+        masque = self._masque(ids)
+        masque[exclus] = False
+        ids = np.flatnonzero(masque)
+        if len(ids) > n:
+            # Seuil du n-ième compte : seuls les candidats au-dessus (ex aequo compris) sont triés
+            comptes = self.comptes[ids]
+            seuil = -np.partition(-comptes, n - 1)[n - 1]
+            ids = ids[comptes >= seuil]
+        return self._classer(ids)[:n]
+
+    def _commence_par(self, requete, mots, exclus, n):
+        debut, fin = self._plage(self._tri, requete)
+        return self._meilleurs(self._ids_tri[debut:fin], exclus, n)
+
+    def _mots_prefixes(self, requete, mots, exclus, n):
+        masque = self._masque(self._prefixe(mots[0]))
+        for q in mots[1:]:
+            masque &= self._masque(self._prefixe(q))
+        return self._meilleurs(np.flatnonzero(masque), exclus, n)
+
+    def _sous_chaine(self, requete, mots, exclus, n):
+        if len(requete) < 3:
+            return np.zeros(0, dtype=np.int64)
+        listes = [self._trigrammes.get(tri) for tri in _trigrammes(requete)]
+        if any(l is None for l in listes):
+            return np.zeros(0, dtype=np.int64)
+        candidats = listes[0]
+        for l in sorted(listes[1:], key=len):
+            candidats = np.intersect1d(candidats, l, assume_unique=True)
+        masque = self._masque(candidats)
+        masque[exclus] = False
+        candidats = np.flatnonzero(masque)
+        if len(listes) == 1:
+            # Un seul trigramme : tous les candidats contiennent la requête
+            return self._meilleurs(candidats, exclus, n)
+        # Vérification dans l'ordre de classement, arrêtée dès n résultats
+        trouves = []
+        for i in self._classer(candidats).tolist():
+            if requete in self.normalises[i]:
+                trouves.append(i)
+                if len(trouves) == n:
+                    break
+        return np.array(trouves, dtype=np.int64)
+
+    def search_text(self, nom):
+        """Texte de filtrage d'une option de liste déroulante : le nom, sa forme normalisée et
+        ses équivalents marque/générique, pour que le filtre du navigateur garde les résultats
+        trouvés ici par la forme normalisée ou par un alias."""
+        normalise = normalize(nom)
+        mots = set()
+        for mot in normalise.split():
+            mots |= self._aliases.get(mot, set())
+        return " ".join([str(nom), normalise] + sorted(mots - set(normalise.split())))
+
+    def search(self, requete, limite=50):
+        requete = normalize(requete)
+        if not requete:
+            return [self.noms[i] for i in self._par_popularite[:limite]]
+        mots = requete.split()
+
+        resultats = np.zeros(0, dtype=np.int64)
+        for classe in (self._commence_par, self._mots_prefixes, self._sous_chaine):
+            if len(resultats) >= limite:
+                break
+            resultats = np.concatenate([resultats, classe(requete, mots, resultats, limite - len(resultats))])
+        return [self.noms[i] for i in resultats[:limite].tolist()]
+
+
+def term_index(st, col):
+    # Index d'une colonne de listes (produits, effets) ou du pays, par version du store
+    cle = (st.path, st.version, col)
+    index = _index.get(cle)
+    if index is None:
+        with _lock:
+            index = _index.get(cle)
+            if index is None:
+                for ancienne in [c for c in _index if c[:2] != cle[:2]]:
+                    del _index[ancienne]
+                if col in ("product_names", "reactions"):
+                    noms, comptes = st.vocab(col).tolist(), st.term_counts(col)
+                else:
+                    noms, comptes = st[f"{col}.labels"].tolist(), st.category_counts(col)
+                # Équivalences marque/générique pour les seuls médicaments
+                aliases = None if col == "product_names" else {}
+                index = _index[cle] = ProductSearchIndex(noms, comptes, aliases)
+    return index
+
+
+def product_index(st):
+    return term_index(st, "product_names")
+
+
+def search_options(st, col, termes, libelle=str):
+    # Options de dcc.Dropdown dont la clé "search" couvre les formes trouvées côté serveur
+    index = term_index(st, col)
+    return [{"label": libelle(t), "value": t, "search": index.search_text(t)} for t in termes]
+
+
+def search_terms(st, col, requete, limite=50):
+    return term_index(st, col).search(requete, limite)
+
+
+def search_products(st, requete, limite=50):
+    return search_terms(st, "product_names", requete, limite)
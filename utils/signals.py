@@ -0,0 +1,109 @@
+import threading
+import numpy as np
+import pandas as pd
+from .data_loader import get_store
+from .instrumentation import record_rows
+
+# Mesures de disproportionnalité calculées pour tous les couples produit x effet
+# à partir des tables 2x2 :            effet   autres effets
+#                       produit          a           b
+#                       autres produits  c           d
+METRICS = {
+    "ror025": "ROR (borne inférieure IC95)",
+    "prr": "PRR",
+    "ic025": "IC (borne inférieure IC95)",
+}
+SCORE_COLUMNS = ["prr", "prr025", "prr975", "ror", "ror025", "ror975", "ic", "ic025", "ic975"]
+Z95 = 1.959964
+
+_signaux = {}
+_lock = threading.Lock()
+
+
+def compute_signals(st):
+    """Scores PRR, ROR et IC (BCPNN) de chaque couple non nul de la matrice de co-occurrence.
+
+    Un seul passage vectorisé sur les tableaux CSR : aucune boucle par couple.
+    """
+    indptr = np.asarray(st["cooc.indptr"])
+    produits = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+    reactions = np.asarray(st["cooc.indices"], dtype=np.int64)
+    a = np.asarray(st["cooc.data"], dtype=np.float64)
+    n = float(len(st))
+    b = np.asarray(st.term_counts("product_names"), dtype=np.float64)[produits] - a
+    c = np.asarray(st.term_counts("reactions"), dtype=np.float64)[reactions] - a
+    d = n - a - b - c
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        prr = (a / (a + b)) / (c / (c + d))
+        se_prr = np.sqrt(1 / a - 1 / (a + b) + 1 / c - 1 / (c + d))
+        ror = (a * d) / (b * c)
+        se_ror = np.sqrt(1 / a + 1 / b + 1 / c + 1 / d)
+        # IC avec lissage bayésien (Norén et al. 2006) et intervalle approché
+        attendu = (a + b) * (a + c) / n
+        ic = np.log2((a + 0.5) / (attendu + 0.5))
+        ic025 = ic - 3.3 * (a + 0.5) ** -0.5 - 2 * (a + 0.5) ** -1.5
+        ic975 = ic + 2.4 * (a + 0.5) ** -0.5 - 0.5 * (a + 0.5) ** -1.5
+
+        scores = {
+            "expected": attendu,
+            "prr": prr,
+            "prr025": np.exp(np.log(prr) - Z95 * se_prr),
+            "prr975": np.exp(np.log(prr) + Z95 * se_prr),
+            "ror": ror,
+            "ror025": np.exp(np.log(ror) - Z95 * se_ror),
+            "ror975": np.exp(np.log(ror) + Z95 * se_ror),
+            "ic": ic,
+            "ic025": ic025,
+            "ic975": ic975,
+        }
+    # float32 : deux fois moins de mémoire sur les millions de couples de FAERS
+    signaux = {"product_id": produits.astype(np.int32), "reaction_id": reactions.astype(np.int32), "count": a.astype(np.int32)}
+    signaux.update({nom: valeurs.astype(np.float32) for nom, valeurs in scores.items()})
+    return signaux
+
+
+def get_signals(st=None):
+    # Scores calculés une fois par version du store
+    st = st or get_store()
+    cle = (st.path, st.version)
+    signaux = _signaux.get(cle)
+    if signaux is None:
+        with _lock:
+            signaux = _signaux.get(cle)
+            if signaux is None:
+                _signaux.clear()
+                signaux = _signaux[cle] = compute_signals(st)
+    return signaux
+
+
+def top_signals(metric="ror025", min_count=3, products=None, reactions=None, limit=100, st=None):
+    """Couples produit x effet classés par score décroissant.
+
+    `min_count` écarte les couples rapportés moins de `min_count` fois ; `products`
+    et `reactions` restreignent le classement à certains termes.
+    """
+    if metric not in SCORE_COLUMNS:
+        raise ValueError(f"Mesure inconnue : {metric}")
+    st = st or get_store()
+    signaux = get_signals(st)
+    score = signaux[metric]
+
+    masque = (signaux["count"] >= min_count) & np.isfinite(score)
+    if products is not None:
+        ids = st.term_ids("product_names", products)
+        masque &= np.isin(signaux["product_id"], ids[ids >= 0])
+    if reactions is not None:
+        ids = st.term_ids("reactions", reactions)
+        masque &= np.isin(signaux["reaction_id"], ids[ids >= 0])
+    record_rows(len(masque))
+    candidats = np.flatnonzero(masque)
+    if limit is not None and len(candidats) > limit:
+        # Sélection partielle avant le tri : seuls les `limit` meilleurs sont triés
+        candidats = candidats[np.argpartition(-score[candidats], limit - 1)[:limit]]
+    candidats = candidats[np.argsort(-score[candidats], kind="stable")]
+
+    table = pd.DataFrame({cle: valeurs[candidats] for cle, valeurs in signaux.items()})
+    table.insert(0, "product", st.vocab("product_names")[table.pop("product_id")])
+    table.insert(1, "reaction", st.vocab("reactions")[table.pop("reaction_id")])
+    return table
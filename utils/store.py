@@ -0,0 +1,773 @@
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from .summary import AGE_BINS, AGE_LABELS, compute_summary
+
+# Format colonnaire sur disque : un fichier .npy par colonne, lisible en memory-map
+# afin que les pages soient partagées entre les processus workers.
+FORMAT_VERSION = 8
+LIST_COLUMNS = ["reactions", "product_names"]
+CATEGORY_COLUMNS = ["sex", "country"]
+NUMERIC_COLUMNS = ["age", "age_unit"]
+# Dimensions du cube temporel (comptes par mois et par terme)
+TIME_COLUMNS = LIST_COLUMNS + ["country"]
+# Tableaux de chaînes (vocabulaires, libellés) : UTF-8 concaténé + offsets sur disque,
+# comme les colonnes de listes, au lieu de fichiers <U à largeur fixe
+STRING_SUFFIXES = (".vocab", ".labels")
+# Construction des index dérivés par blocs de déclarations : lignes relues par bloc et
+# matrices de comptes construites par plages de termes d'au plus DERIVE_PAIRS couples
+DERIVE_ROWS = 200_000
+DERIVE_PAIRS = 2_000_000
+
+
+def source_signature(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def source_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloc in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloc)
+    return h.hexdigest()
+
+
+def store_path(source, cache_dir):
+    nom = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(cache_dir, f"{nom}.store")
+
+
+def csr_take(offsets, ids, lignes):
+    # Concaténation des listes des déclarations `lignes`, sans boucle Python
+    lignes = np.asarray(lignes, dtype=np.int64)
+    debuts = offsets[lignes]
+    longueurs = offsets[lignes + 1] - debuts
+    decalage = np.repeat(debuts - np.cumsum(longueurs) + longueurs, longueurs)
+    return np.asarray(ids)[decalage + np.arange(longueurs.sum())]
+
+
+def cooccurrence_matrix(p_offsets, p_ids, r_offsets, r_ids, n_produits, n_reactions, taille_bloc=200_000):
+    # Matrice creuse produit x effet au format CSR (indptr, indices, data) :
+    # data = nombre de déclarations citant à la fois le produit et l'effet
+    n = len(p_offsets) - 1
+    n_reactions = max(n_reactions, 1)
+    cles, comptes = [], []
+    for debut in range(0, n, taille_bloc):
+        fin = min(debut + taille_bloc, n)
+        lignes = np.repeat(np.arange(debut, fin, dtype=np.int64), np.diff(p_offsets[debut:fin + 1]))
+        produits = p_ids[p_offsets[debut]:p_offsets[fin]]
+        repetitions = r_offsets[lignes + 1] - r_offsets[lignes]
+        paires = np.repeat(produits.astype(np.int64), repetitions) * n_reactions + csr_take(r_offsets, r_ids, lignes)
+        uniques, nb = np.unique(paires, return_counts=True)
+        cles.append(uniques)
+        comptes.append(nb)
+    cles = np.concatenate(cles) if cles else np.zeros(0, dtype=np.int64)
+    comptes = np.concatenate(comptes) if comptes else np.zeros(0, dtype=np.int64)
+    cles, inverse = np.unique(cles, return_inverse=True)
+    data = np.bincount(inverse, weights=comptes, minlength=len(cles)).astype(np.int32)
+    lignes, indices = np.divmod(cles, n_reactions)
+    indptr = np.zeros(n_produits + 1, dtype=np.int64)
+    np.cumsum(np.bincount(lignes, minlength=n_produits), out=indptr[1:])
+    return indptr, indices.astype(np.int32), data
+
+
+def _coder(vocab, valeurs):
+    # Valeurs -> ids globaux ; les nouveaux termes reçoivent l'id suivant (-1 pour NaN)
+    codes, uniques = pd.factorize(pd.Series(valeurs, dtype=object))
+    globaux = np.array([vocab.setdefault(u, len(vocab)) for u in uniques] + [-1], dtype=np.int64)
+    return globaux[codes]
+
+
+def _dedoublonner(lignes, ids, taille, n):
+    # Ids triés et sans doublon à l'intérieur de chaque déclaration
+    taille = max(taille, 1)
+    lignes, ids = np.divmod(np.unique(lignes * taille + ids), taille)
+    return np.bincount(lignes, minlength=n), ids
+
+
+def _chaines(valeurs):
+    # Tableau objet de chaînes : forme en mémoire des vocabulaires et libellés
+    valeurs = list(valeurs)
+    chaines = np.empty(len(valeurs), dtype=object)
+    chaines[:] = valeurs
+    return chaines
+
+
+def encode_strings(valeurs):
+    """Chaînes -> (offsets int64, octets UTF-8 uint8) au format CSR."""
+    encodees = [str(v).encode("utf-8") for v in valeurs]
+    offsets = _offsets(np.fromiter(map(len, encodees), dtype=np.int64, count=len(encodees)))
+    return offsets, np.frombuffer(b"".join(encodees), dtype=np.uint8)
+
+
+def decode_strings(offsets, octets):
+    donnees = np.asarray(octets).tobytes()
+    bornes = np.asarray(offsets).tolist()
+    return _chaines(donnees[a:b].decode("utf-8") for a, b in zip(bornes[:-1], bornes[1:]))
+
+
+def _offsets(longueurs, depart=0):
+    offsets = np.empty(len(longueurs) + 1, dtype=np.int64)
+    offsets[0] = depart
+    np.cumsum(longueurs, out=offsets[1:])
+    offsets[1:] += depart
+    return offsets
+
+
+def _bincount(codes, taille):
+    codes = np.asarray(codes)
+    return np.bincount(codes[codes >= 0], minlength=taille).astype(np.int64)
+
+
+def age_group_codes(ages):
+    # Tranche d'âge de chaque déclaration (-1 hors tranches ou âge manquant)
+    codes = pd.cut(np.asarray(ages), bins=AGE_BINS, labels=False, right=False)
+    return np.nan_to_num(codes, nan=-1).astype(np.int64)
+
+
+def encode_batch(df, vocabs):
+    # Lot de déclarations -> colonnes codées avec les vocabulaires `vocabs` (complétés au besoin)
+    n = len(df)
+    lot = {"date": pd.to_datetime(df["date"]).to_numpy(dtype="datetime64[D]")}
+    for col in NUMERIC_COLUMNS:
+        lot[col] = df[col].to_numpy(dtype=np.float64)
+    for col in CATEGORY_COLUMNS:
+        lot[f"{col}.codes"] = _coder(vocabs[col], df[col].to_numpy(dtype=object)).astype(np.int32)
+    for col in LIST_COLUMNS:
+        listes = df[col].tolist()
+        tailles = np.fromiter((len(l) for l in listes), dtype=np.int64, count=n)
+        codes = _coder(vocabs[col], [v for l in listes for v in l])
+        lignes = np.repeat(np.arange(n, dtype=np.int64), tailles)
+        lot[f"{col}.lengths"], codes = _dedoublonner(lignes, codes, len(vocabs[col]), n)
+        lot[f"{col}.ids"] = codes.astype(np.int32)
+    return lot
+
+
+def count_arrays(arrays):
+    # Agrégats persistés : nombre de déclarations par terme, par catégorie et par tranche d'âge
+    comptes = {}
+    for col in LIST_COLUMNS:
+        comptes[f"{col}.counts"] = _bincount(arrays[f"{col}.ids"], len(arrays[f"{col}.vocab"]))
+    for col in CATEGORY_COLUMNS:
+        comptes[f"{col}.counts"] = _bincount(arrays[f"{col}.codes"], len(arrays[f"{col}.labels"]))
+    comptes["age.counts"] = _bincount(age_group_codes(arrays["age"]), len(AGE_LABELS))
+    return comptes
+
+
+def month_index(dates):
+    # Mois écoulés depuis janvier 1970 (-1 pour une date manquante ou antérieure)
+    mois = np.asarray(dates).astype("datetime64[M]").astype(np.int64)
+    return np.where(mois < 0, -1, mois)
+
+
+def _csr_from_pairs(lignes, colonnes, n_lignes):
+    # Comptes des couples (ligne, colonne) au format CSR
+    n_colonnes = int(colonnes.max()) + 1 if len(colonnes) else 1
+    cles, comptes = np.unique(lignes * n_colonnes + colonnes, return_counts=True)
+    lignes, indices = np.divmod(cles, n_colonnes)
+    return _offsets(np.bincount(lignes, minlength=n_lignes)), indices.astype(np.int32), comptes.astype(np.int32)
+
+
+def _time_pairs(termes, lignes, mois):
+    termes = np.asarray(termes, dtype=np.int64)
+    mois = mois[lignes]
+    garder = (termes >= 0) & (mois >= 0)
+    return termes[garder], mois[garder]
+
+
+def time_cube(arrays, lengths=None):
+    """Cube temporel : pour chaque dimension, matrice CSR terme x mois des nombres de déclarations.
+
+    `lengths` permet de passer un lot encodé (longueurs de listes au lieu d'offsets).
+    """
+    n = len(arrays["date"])
+    mois = month_index(arrays["date"])
+    cube = {"timecube.total": _bincount(mois, int(mois.max()) + 1 if n else 0)}
+    for col in TIME_COLUMNS:
+        if col in LIST_COLUMNS:
+            longueurs = lengths[col] if lengths else np.diff(arrays[f"{col}.offsets"])
+            lignes = np.repeat(np.arange(n, dtype=np.int64), longueurs)
+            termes, n_termes = arrays[f"{col}.ids"], len(arrays[f"{col}.vocab"])
+        else:
+            lignes = np.arange(n, dtype=np.int64)
+            termes, n_termes = arrays[f"{col}.codes"], len(arrays[f"{col}.labels"])
+        termes, mois_termes = _time_pairs(termes, lignes, mois)
+        cube[f"timecube.{col}.indptr"], cube[f"timecube.{col}.months"], cube[f"timecube.{col}.counts"] = \
+            _csr_from_pairs(termes, mois_termes, n_termes)
+    return cube
+
+
+def _tableau(dossier, nom, dtype, taille):
+    # Tableau de sortie : memory-mappé dans `dossier` s'il est donné, en mémoire sinon
+    if dossier is None:
+        return np.zeros(taille, dtype=dtype)
+    return np.lib.format.open_memmap(os.path.join(dossier, f"{nom}.npy"), mode="w+", dtype=dtype, shape=(taille,))
+
+
+def _blocs(n, taille_bloc):
+    return [(debut, min(debut + taille_bloc, n)) for debut in range(0, n, taille_bloc)]
+
+
+def _entrees(arrays, col, debut, fin):
+    # (termes, numéros de déclarations) des déclarations [debut, fin) d'une colonne de listes ou de catégories
+    if col in LIST_COLUMNS:
+        offsets = np.asarray(arrays[f"{col}.offsets"][debut:fin + 1])
+        termes = np.asarray(arrays[f"{col}.ids"][offsets[0]:offsets[-1]], dtype=np.int64)
+        return termes, np.repeat(np.arange(debut, fin, dtype=np.int64), np.diff(offsets))
+    codes = np.asarray(arrays[f"{col}.codes"][debut:fin], dtype=np.int64)
+    presents = np.flatnonzero(codes >= 0)
+    return codes[presents], debut + presents
+
+
+_NAT = np.iinfo(np.int64).min
+
+
+def _jours(dates):
+    # Jours depuis 1970 ; une date manquante vaut _NAT
+    return np.asarray(dates).astype("datetime64[D]").view(np.int64)
+
+
+def _postings_par_blocs(entrees, comptes, sortie):
+    # Index inversé écrit en place : chaque bloc (termes, lignes croissantes) est rangé à la
+    # suite des précédents dans la liste de chaque terme, qui reste donc triée
+    indptr = _offsets(comptes)
+    curseur = indptr[:-1].copy()
+    for termes, lignes in entrees:
+        ordre = np.argsort(termes, kind="stable")
+        termes = termes[ordre]
+        nb = np.bincount(termes, minlength=len(comptes))
+        rang = np.arange(len(termes), dtype=np.int64) - _offsets(nb)[:-1][termes]
+        sortie[curseur[termes] + rang] = lignes[ordre]
+        curseur += nb
+    return indptr, sortie
+
+
+def _plages(poids, budget):
+    # Plages de lignes consécutives dont la somme des poids tient dans `budget` (au moins une ligne)
+    cumul = np.cumsum(poids)
+    plages, debut = [], 0
+    while debut < len(poids):
+        base = cumul[debut - 1] if debut else 0
+        fin = max(int(np.searchsorted(cumul, base + budget, side="right")), debut + 1)
+        plages.append((debut, fin))
+        debut = fin
+    return plages
+
+
+def _csr_par_plages(n_lignes, n_colonnes, poids, paires, budget, dossier, noms):
+    """Matrice de comptes CSR construite plage de lignes par plage de lignes.
+
+    `poids` majore le nombre de couples de chaque ligne et `paires(a, b)` produit, bloc
+    par bloc, les couples (ligne, colonne) des lignes [a, b) : seule une plage est en
+    mémoire à la fois. `noms` nomme les sorties (indptr, indices, data).
+    """
+    n_colonnes = max(n_colonnes, 1)
+    longueurs = np.zeros(n_lignes, dtype=np.int64)
+    morceaux = []
+    for a, b in _plages(poids, budget):
+        cles, comptes = [], []
+        for lignes, colonnes in paires(a, b):
+            uniques, nb = np.unique((lignes - a) * n_colonnes + colonnes, return_counts=True)
+            cles.append(uniques)
+            comptes.append(nb)
+        if not cles:
+            continue
+        cles, inverse = np.unique(np.concatenate(cles), return_inverse=True)
+        data = np.bincount(inverse, weights=np.concatenate(comptes), minlength=len(cles)).astype(np.int32)
+        lignes, indices = np.divmod(cles, n_colonnes)
+        longueurs[a:b] = np.bincount(lignes, minlength=b - a)
+        morceau = (indices.astype(np.int32), data)
+        if dossier is not None:
+            # Plage terminée déposée sur disque jusqu'à l'assemblage
+            chemin = os.path.join(dossier, f"{noms[0]}.{a:09d}.npz")
+            np.savez(chemin, *morceau)
+            morceau = chemin
+        morceaux.append(morceau)
+    indptr = _offsets(longueurs)
+    indices, data = (_tableau(dossier, nom, np.int32, indptr[-1]) for nom in noms[1:])
+    position = 0
+    for morceau in morceaux:
+        if dossier is not None:
+            with np.load(morceau) as f:
+                morceau = (f["arr_0"], f["arr_1"])
+        indices[position:position + len(morceau[0])], data[position:position + len(morceau[0])] = morceau
+        position += len(morceau[0])
+    return indptr, indices, data
+
+
+def derived_arrays(arrays, dossier=None, taille_bloc=None, budget=None):
+    """Agrégats, index inversés, ordre des dates, co-occurrences et cube temporel.
+
+    Les colonnes sont relues par blocs de `taille_bloc` déclarations et les grands
+    tableaux de sortie sont memory-mappés dans `dossier` s'il est donné : la mémoire
+    utilisée dépend de la taille des blocs et des vocabulaires, pas du nombre de
+    déclarations.
+    """
+    n = len(arrays["date"])
+    taille_bloc, budget = taille_bloc or DERIVE_ROWS, budget or DERIVE_PAIRS
+    blocs = _blocs(n, taille_bloc)
+    tailles = {col: len(arrays[f"{col}.vocab"]) for col in LIST_COLUMNS}
+    tailles.update({col: len(arrays[f"{col}.labels"]) for col in CATEGORY_COLUMNS})
+
+    # Premier passage : comptes, bornes des dates et poids des plages de co-occurrence
+    comptes = {col: np.zeros(tailles[col], dtype=np.int64) for col in tailles}
+    ages = np.zeros(len(AGE_LABELS), dtype=np.int64)
+    poids_cooc = np.zeros(tailles["product_names"], dtype=np.int64)
+    jours_connus, mois_max = [], -1
+    for debut, fin in blocs:
+        for col in tailles:
+            comptes[col] += np.bincount(_entrees(arrays, col, debut, fin)[0], minlength=tailles[col])
+        ages += _bincount(age_group_codes(arrays["age"][debut:fin]), len(AGE_LABELS))
+        produits, lignes = _entrees(arrays, "product_names", debut, fin)
+        r_offsets = np.asarray(arrays["reactions.offsets"][debut:fin + 1])
+        poids_cooc += np.bincount(produits, weights=np.diff(r_offsets)[lignes - debut],
+                                  minlength=tailles["product_names"]).astype(np.int64)
+        jours = _jours(arrays["date"][debut:fin])
+        jours = jours[jours != _NAT]
+        if len(jours):
+            jours_connus += [jours.min(), jours.max()]
+        mois_max = max(mois_max, int(month_index(arrays["date"][debut:fin]).max(initial=-1)))
+    derives = {f"{col}.counts": comptes[col] for col in tailles}
+    derives["age.counts"] = ages
+
+    for col in LIST_COLUMNS + ["country"]:
+        sortie = _tableau(dossier, f"{col}.postings.rows", np.int64, comptes[col].sum())
+        derives[f"{col}.postings.indptr"], derives[f"{col}.postings.rows"] = _postings_par_blocs(
+            (_entrees(arrays, col, debut, fin) for debut, fin in blocs), comptes[col], sortie)
+
+    # Ordre des dates : tri par dénombrement des jours, stable comme np.argsort (dates
+    # manquantes en dernier), écrit comme un index inversé jour -> déclarations
+    jour_min = min(jours_connus, default=0)
+    n_jours = max(jours_connus, default=-1) - jour_min + 2
+
+    def jours_par_bloc():
+        for debut, fin in blocs:
+            jours = _jours(arrays["date"][debut:fin])
+            yield np.where(jours == _NAT, n_jours - 1, jours - jour_min), np.arange(debut, fin, dtype=np.int64)
+
+    comptes_jours = np.zeros(n_jours, dtype=np.int64)
+    for jours, _ in jours_par_bloc():
+        comptes_jours += np.bincount(jours, minlength=n_jours)
+    derives["date.order"] = _postings_par_blocs(
+        jours_par_bloc(), comptes_jours, _tableau(dossier, "date.order", np.int64, n))[1]
+
+    # Co-occurrences produit x effet, par plages de produits
+    def paires_cooc(a, b):
+        for debut, fin in blocs:
+            produits, lignes = _entrees(arrays, "product_names", debut, fin)
+            garder = (produits >= a) & (produits < b)
+            produits, lignes = produits[garder], lignes[garder] - debut
+            r_offsets = np.asarray(arrays["reactions.offsets"][debut:fin + 1])
+            r_ids = np.asarray(arrays["reactions.ids"][r_offsets[0]:r_offsets[-1]], dtype=np.int64)
+            r_offsets = r_offsets - r_offsets[0]
+            yield (np.repeat(produits, r_offsets[lignes + 1] - r_offsets[lignes]),
+                   csr_take(r_offsets, r_ids, lignes))
+
+    derives["cooc.indptr"], derives["cooc.indices"], derives["cooc.data"] = _csr_par_plages(
+        tailles["product_names"], tailles["reactions"], poids_cooc, paires_cooc, budget, dossier,
+        ["cooc.indptr", "cooc.indices", "cooc.data"])
+
+    # Cube temporel terme x mois, par plages de termes
+    total = np.zeros(mois_max + 1, dtype=np.int64)
+    for debut, fin in blocs:
+        mois = month_index(arrays["date"][debut:fin])
+        total += _bincount(mois, mois_max + 1)
+    derives["timecube.total"] = total
+    for col in TIME_COLUMNS:
+        def paires_cube(a, b, col=col):
+            for debut, fin in blocs:
+                termes, lignes = _entrees(arrays, col, debut, fin)
+                termes, mois = _time_pairs(termes, lignes - debut, month_index(arrays["date"][debut:fin]))
+                garder = (termes >= a) & (termes < b)
+                yield termes[garder], mois[garder]
+
+        prefixe = f"timecube.{col}"
+        derives[f"{prefixe}.indptr"], derives[f"{prefixe}.months"], derives[f"{prefixe}.counts"] = _csr_par_plages(
+            tailles[col], mois_max + 1, comptes[col], paires_cube, budget, dossier,
+            [f"{prefixe}.indptr", f"{prefixe}.months", f"{prefixe}.counts"])
+    return derives
+
+
+def _merge_postings(indptr, rows, n_termes, ids, lignes):
+    # Les nouvelles déclarations ont des numéros supérieurs aux anciennes :
+    # les insérer en fin de liste garde chaque posting trié
+    indptr = np.concatenate([indptr, np.full(n_termes + 1 - len(indptr), indptr[-1])])
+    ordre = np.argsort(ids, kind="stable")
+    rows = np.insert(rows, indptr[ids[ordre] + 1], lignes[ordre])
+    return indptr + _offsets(np.bincount(ids, minlength=n_termes)), rows
+
+
+def merge_csr(indptr, indices, data, n_lignes, nouveau):
+    # Somme de deux matrices de comptes CSR (la nouvelle peut avoir plus de lignes)
+    n_colonnes = int(max(indices.max(initial=0), nouveau[1].max(initial=0))) + 1
+    lignes = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+    n_lignes_lot = np.repeat(np.arange(n_lignes, dtype=np.int64), np.diff(nouveau[0]))
+    cles = np.concatenate([lignes * n_colonnes + indices, n_lignes_lot * n_colonnes + nouveau[1]])
+    cles, inverse = np.unique(cles, return_inverse=True)
+    data = np.bincount(inverse, weights=np.concatenate([data, nouveau[2]]), minlength=len(cles)).astype(np.int32)
+    lignes, indices = np.divmod(cles, n_colonnes)
+    return _offsets(np.bincount(lignes, minlength=n_lignes)), indices.astype(np.int32), data
+
+
+def append_arrays(st, df):
+    """Ajoute un lot de déclarations aux tableaux d'un store existant.
+
+    Les nouveaux termes sont ajoutés en fin de vocabulaire (les ids existants ne
+    changent pas) et les structures dérivées sont fusionnées au lieu d'être recalculées.
+    Les tableaux renvoyés sont complets (anciens + lot), à réécrire par `save_arrays`.
+    """
+    n0, n = len(st), len(df)
+    anciens = {nom: np.asarray(st[nom]) for nom in st.names()}
+    vocabs = {col: {t: i for i, t in enumerate(anciens[f"{col}.labels"].tolist())} for col in CATEGORY_COLUMNS}
+    vocabs.update({col: {t: i for i, t in enumerate(anciens[f"{col}.vocab"].tolist())} for col in LIST_COLUMNS})
+    lot = encode_batch(df, vocabs)
+
+    arrays = dict(anciens)
+    for col in ["date"] + NUMERIC_COLUMNS:
+        arrays[col] = np.concatenate([anciens[col], lot[col]])
+    for col in CATEGORY_COLUMNS:
+        arrays[f"{col}.labels"] = _chaines(vocabs[col])
+        arrays[f"{col}.codes"] = np.concatenate([anciens[f"{col}.codes"], lot[f"{col}.codes"]])
+    for col in LIST_COLUMNS:
+        arrays[f"{col}.vocab"] = _chaines(vocabs[col])
+        arrays[f"{col}.ids"] = np.concatenate([anciens[f"{col}.ids"], lot[f"{col}.ids"]])
+        arrays[f"{col}.offsets"] = np.concatenate([anciens[f"{col}.offsets"], _offsets(lot[f"{col}.lengths"], anciens[f"{col}.offsets"][-1])[1:]])
+
+    # Agrégats : on ajoute les comptes du lot aux comptes existants
+    comptes_lot = count_arrays({**lot, **{f"{col}.vocab": arrays[f"{col}.vocab"] for col in LIST_COLUMNS},
+                                **{f"{col}.labels": arrays[f"{col}.labels"] for col in CATEGORY_COLUMNS}})
+    for nom, comptes in comptes_lot.items():
+        ancien = anciens[nom]
+        arrays[nom] = comptes + np.pad(ancien, (0, len(comptes) - len(ancien)))
+
+    # Index inversés
+    for col in LIST_COLUMNS:
+        lignes = n0 + np.repeat(np.arange(n, dtype=np.int64), lot[f"{col}.lengths"])
+        arrays[f"{col}.postings.indptr"], arrays[f"{col}.postings.rows"] = _merge_postings(
+            anciens[f"{col}.postings.indptr"], anciens[f"{col}.postings.rows"],
+            len(arrays[f"{col}.vocab"]), lot[f"{col}.ids"].astype(np.int64), lignes)
+    codes = lot["country.codes"]
+    presents = np.flatnonzero(codes >= 0)
+    arrays["country.postings.indptr"], arrays["country.postings.rows"] = _merge_postings(
+        anciens["country.postings.indptr"], anciens["country.postings.rows"],
+        len(arrays["country.labels"]), codes[presents].astype(np.int64), n0 + presents)
+
+    # Ordre des dates : fusion de deux suites triées
+    ordre_lot = np.argsort(lot["date"], kind="stable")
+    positions = np.searchsorted(anciens["date"][anciens["date.order"]], lot["date"][ordre_lot], side="right")
+    arrays["date.order"] = np.insert(anciens["date.order"], positions, ordre_lot + n0)
+
+    # Co-occurrences : comptes du lot ajoutés à la matrice existante
+    n_produits, n_reactions = len(arrays["product_names.vocab"]), len(arrays["reactions.vocab"])
+    nouveau = cooccurrence_matrix(
+        _offsets(lot["product_names.lengths"]), lot["product_names.ids"],
+        _offsets(lot["reactions.lengths"]), lot["reactions.ids"], n_produits, n_reactions)
+    arrays["cooc.indptr"], arrays["cooc.indices"], arrays["cooc.data"] = merge_csr(
+        anciens["cooc.indptr"], anciens["cooc.indices"], anciens["cooc.data"], n_produits, nouveau)
+
+    # Cube temporel : comptes mensuels du lot ajoutés, nouveaux mois compris
+    cube = time_cube({**lot, **{f"{col}.vocab": arrays[f"{col}.vocab"] for col in LIST_COLUMNS},
+                      **{f"{col}.labels": arrays[f"{col}.labels"] for col in CATEGORY_COLUMNS}},
+                     lengths={col: lot[f"{col}.lengths"] for col in LIST_COLUMNS})
+    total, ancien = cube["timecube.total"], anciens["timecube.total"]
+    taille = max(len(total), len(ancien))
+    arrays["timecube.total"] = np.pad(total, (0, taille - len(total))) + np.pad(ancien, (0, taille - len(ancien)))
+    for col in TIME_COLUMNS:
+        prefixe = f"timecube.{col}"
+        arrays[f"{prefixe}.indptr"], arrays[f"{prefixe}.months"], arrays[f"{prefixe}.counts"] = merge_csr(
+            anciens[f"{prefixe}.indptr"], anciens[f"{prefixe}.months"], anciens[f"{prefixe}.counts"],
+            len(cube[f"{prefixe}.indptr"]) - 1,
+            (cube[f"{prefixe}.indptr"], cube[f"{prefixe}.months"], cube[f"{prefixe}.counts"]))
+    return arrays
+
+
+def current_version(path):
+    try:
+        with open(os.path.join(path, "CURRENT")) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+@contextmanager
+def store_lock(path):
+    # Verrou inter-processus : un seul build ou ajout à la fois par store
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def save_arrays(arrays, path, meta):
+    """Écrit une nouvelle version du store puis bascule le pointeur CURRENT.
+
+    Le remplacement du pointeur est atomique : les workers voient soit l'ancienne
+    version, soit la nouvelle, et ceux qui ont déjà mappé l'ancienne gardent des
+    fichiers valides jusqu'à leur rechargement.
+    """
+    os.makedirs(path, exist_ok=True)
+    precedente = current_version(path)
+    version = f"{int(precedente or 0) + 1:06d}"
+    tmp = os.path.join(path, f".tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for nom, arr in arrays.items():
+        if nom.endswith(STRING_SUFFIXES):
+            offsets, octets = encode_strings(arr)
+            np.save(os.path.join(tmp, f"{nom}.offsets.npy"), offsets, allow_pickle=False)
+            np.save(os.path.join(tmp, f"{nom}.bytes.npy"), octets, allow_pickle=False)
+        else:
+            np.save(os.path.join(tmp, f"{nom}.npy"), arr, allow_pickle=False)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(dict(meta, version=version), f)
+    with open(os.path.join(tmp, "summary.json"), "w") as f:
+        json.dump(compute_summary(arrays), f)
+    os.replace(tmp, os.path.join(path, version))
+
+    pointeur = os.path.join(path, f"CURRENT.tmp-{os.getpid()}")
+    with open(pointeur, "w") as f:
+        f.write(version)
+    os.replace(pointeur, os.path.join(path, "CURRENT"))
+
+    # On garde la version précédente pour les lectures en cours
+    for nom in os.listdir(path):
+        if nom not in (version, precedente) and os.path.isdir(os.path.join(path, nom)):
+            shutil.rmtree(os.path.join(path, nom), ignore_errors=True)
+
+
+class StoreWriter:
+    """Construction du store par lots, à mémoire bornée.
+
+    Chaque lot codé est écrit sur disque (fichiers .npy dans un répertoire de travail
+    à côté du store) ; seuls les vocabulaires restent en mémoire. `finish()` assemble
+    les colonnes dans des fichiers memory-mappés, lot par lot, puis calcule les index
+    dérivés par blocs (`derived_arrays`) directement dans des fichiers memory-mappés.
+    """
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = dict(meta)
+        self.n = 0
+        self._vocabs = {col: {} for col in CATEGORY_COLUMNS + LIST_COLUMNS}
+        self._travail = os.path.join(os.path.dirname(os.path.abspath(path)), f".{os.path.basename(path)}.build-{os.getpid()}")
+        shutil.rmtree(self._travail, ignore_errors=True)
+        os.makedirs(self._travail)
+        self._lots = []
+        self._n_ids = {col: 0 for col in LIST_COLUMNS}
+
+    def append(self, df):
+        lot = encode_batch(df, self._vocabs)
+        dossier = os.path.join(self._travail, f"lot-{len(self._lots):06d}")
+        os.makedirs(dossier)
+        for nom, arr in lot.items():
+            np.save(os.path.join(dossier, f"{nom}.npy"), arr, allow_pickle=False)
+        self._lots.append((dossier, len(df)))
+        for col in LIST_COLUMNS:
+            self._n_ids[col] += len(lot[f"{col}.ids"])
+        self.n += len(df)
+
+    def _parties(self, nom):
+        for dossier, n in self._lots:
+            yield np.load(os.path.join(dossier, f"{nom}.npy"), mmap_mode="r"), n
+
+    def _colonne(self, nom, dtype, taille, transformer=None):
+        # Colonne finale memory-mappée, remplie lot par lot
+        sortie = np.lib.format.open_memmap(os.path.join(self._travail, f"{nom}.npy"), mode="w+", dtype=dtype, shape=(taille,))
+        position = 0
+        for morceau, n in self._parties(nom):
+            morceau = transformer(morceau, n) if transformer else morceau
+            sortie[position:position + len(morceau)] = morceau
+            position += len(morceau)
+        return sortie
+
+    def finish(self):
+        try:
+            arrays = {"date": self._colonne("date", "datetime64[D]", self.n)}
+            for col in NUMERIC_COLUMNS:
+                arrays[col] = self._colonne(col, np.float64, self.n)
+            for col in CATEGORY_COLUMNS:
+                # Libellés triés pour un build complet
+                labels = _chaines(self._vocabs[col])
+                ordre = np.argsort(labels, kind="stable")
+                rang = np.append(np.argsort(ordre), -1).astype(np.int32)
+                arrays[f"{col}.codes"] = self._colonne(f"{col}.codes", np.int32, self.n, lambda c, n: rang[c])
+                arrays[f"{col}.labels"] = labels[ordre]
+            for col in LIST_COLUMNS:
+                termes = _chaines(self._vocabs[col])
+                ordre = np.argsort(termes, kind="stable")
+                rang = np.argsort(ordre)
+                longueurs = self._colonne(f"{col}.lengths", np.int64, self.n)
+                lengths = iter([l for l, _ in self._parties(f"{col}.lengths")])
+
+                def renumeroter(ids, n):
+                    # Ids renumérotés dans l'ordre alphabétique puis retriés dans chaque déclaration
+                    lignes = np.repeat(np.arange(n, dtype=np.int64), next(lengths))
+                    return _dedoublonner(lignes, rang[ids], len(termes), n)[1].astype(np.int32)
+
+                arrays[f"{col}.ids"] = self._colonne(f"{col}.ids", np.int32, self._n_ids[col], renumeroter)
+                offsets = _tableau(self._travail, f"{col}.offsets", np.int64, self.n + 1)
+                offsets[0] = 0
+                np.cumsum(longueurs, out=offsets[1:])
+                arrays[f"{col}.offsets"] = offsets
+                arrays[f"{col}.vocab"] = termes[ordre]
+            arrays.update(derived_arrays(arrays, self._travail))
+
+            save_arrays(arrays, self.path, dict(self.meta, format=FORMAT_VERSION, n_reports=self.n))
+        finally:
+            shutil.rmtree(self._travail, ignore_errors=True)
+            self._lots = []
+
+
+def write_store(df, path, meta):
+    writer = StoreWriter(path, meta)
+    writer.append(df)
+    writer.finish()
+
+
+def read_meta(path):
+    version = current_version(path)
+    if version is None:
+        return None
+    try:
+        with open(os.path.join(path, version, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(path, source):
+    meta = read_meta(path)
+    if meta is None or meta.get("format") != FORMAT_VERSION:
+        return False
+    if meta.get("signature") == source_signature(source):
+        return True
+    # Fichier source touché mais contenu identique
+    return meta.get("sha256") == source_hash(source)
+
+
+def _jour(date):
+    return np.datetime64(pd.Timestamp(date).date(), "D")
+
+
+class ReportStore:
+    def __init__(self, path):
+        self.path = path
+        self.meta = read_meta(path)
+        self.version = self.meta["version"]
+        dossier = os.path.join(path, self.version)
+        with open(os.path.join(dossier, "summary.json")) as f:
+            self.summary = json.load(f)
+        self.arrays = {}
+        for nom in os.listdir(dossier):
+            if nom.endswith(".npy"):
+                self.arrays[nom[:-4]] = np.load(os.path.join(dossier, nom), mmap_mode="r")
+        # Chaînes (octets + offsets) décodées à la première lecture
+        self._chaines = {nom[:-len(".bytes")] for nom in self.arrays
+                         if nom.endswith(".bytes") and nom[:-len(".bytes")].endswith(STRING_SUFFIXES)}
+        self._derives = {}
+
+    def __len__(self):
+        return self.meta["n_reports"]
+
+    def __getitem__(self, nom):
+        if nom in self._chaines:
+            return self._derive(("chaînes", nom), lambda: decode_strings(
+                self.arrays[f"{nom}.offsets"], self.arrays[f"{nom}.bytes"]))
+        return self.arrays[nom]
+
+    def names(self):
+        # Tableaux logiques du store : les chaînes remplacent leurs fichiers octets/offsets
+        parties = {f"{nom}.{partie}" for nom in self._chaines for partie in ("offsets", "bytes")}
+        return [nom for nom in self.arrays if nom not in parties] + sorted(self._chaines)
+
+    def category(self, col):
+        codes, labels = self[f"{col}.codes"], self[f"{col}.labels"]
+        valeurs = np.asarray(labels, dtype=object)[np.maximum(codes, 0)]
+        valeurs[np.asarray(codes) < 0] = None
+        return valeurs
+
+    def _derive(self, cle, calcul):
+        # Tableaux dérivés calculés une fois par processus
+        if cle not in self._derives:
+            self._derives[cle] = calcul()
+        return self._derives[cle]
+
+    def vocab(self, col):
+        return self[f"{col}.vocab"]
+
+    def term_ids(self, col, termes):
+        # Termes -> ids (-1 pour un terme inconnu), dans l'ordre demandé
+        index = self._derive(("index", col), lambda: {t: i for i, t in enumerate(self.vocab(col).tolist())})
+        return np.array([index.get(t, -1) for t in termes], dtype=np.int64)
+
+    def row_ids(self, col):
+        # Numéro de déclaration de chaque entrée de `{col}.ids`
+        offsets = self[f"{col}.offsets"]
+        return self._derive(("lignes", col), lambda: np.repeat(
+            np.arange(len(self), dtype=np.int64), np.diff(offsets)))
+
+    def term_counts(self, col):
+        # Nombre de déclarations mentionnant chaque terme
+        return self[f"{col}.counts"]
+
+    def category_ids(self, col, valeurs):
+        index = self._derive(("index", col), lambda: {t: i for i, t in enumerate(self[f"{col}.labels"].tolist())})
+        return np.array([index.get(v, -1) for v in valeurs], dtype=np.int64)
+
+    def category_counts(self, col):
+        return self[f"{col}.counts"]
+
+    def postings(self, col, terme_id):
+        # Déclarations (triées) mentionnant le terme `terme_id` de la colonne `col`
+        debut, fin = self[f"{col}.postings.indptr"][terme_id:terme_id + 2]
+        return self[f"{col}.postings.rows"][debut:fin]
+
+    def rows_between(self, debut=None, fin=None):
+        # Déclarations (triées) dont la date est dans [debut, fin], par recherche dichotomique
+        ordre = self["date.order"]
+        dates = self._derive(("dates triées",), lambda: np.asarray(self["date"])[ordre])
+        # Bornes lues par pandas, comme à la validation des filtres (formats non ISO compris)
+        bas = 0 if debut is None else np.searchsorted(dates, _jour(debut), side="left")
+        haut = len(dates) if fin is None else np.searchsorted(dates, _jour(fin), side="right")
+        return np.sort(ordre[bas:haut])
+
+    def cooccurrences(self, produit_id):
+        # Ligne `produit_id` de la matrice produit x effet : (ids d'effets, comptes)
+        debut, fin = self["cooc.indptr"][produit_id:produit_id + 2]
+        return self["cooc.indices"][debut:fin], self["cooc.data"][debut:fin]
+
+    def time_series(self, col, terme_id):
+        # Ligne `terme_id` du cube temporel : (mois depuis 1970, nombre de déclarations)
+        debut, fin = self[f"timecube.{col}.indptr"][terme_id:terme_id + 2]
+        return self[f"timecube.{col}.months"][debut:fin], self[f"timecube.{col}.counts"][debut:fin]
+
+    def take(self, col, lignes):
+        return csr_take(self[f"{col}.offsets"], self[f"{col}.ids"], lignes)
+
+    def lists(self, col):
+        offsets = self[f"{col}.offsets"].tolist()
+        valeurs = self.vocab(col)[self[f"{col}.ids"]].tolist()
+        return [valeurs[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+
+    def to_frame(self):
+        df = pd.DataFrame({"date": pd.Series(self["date"]).dt.strftime("%Y-%m-%d")})
+        for col in NUMERIC_COLUMNS:
+            df[col] = np.asarray(self[col])
+        for col in CATEGORY_COLUMNS:
+            df[col] = self.category(col)
+        for col in LIST_COLUMNS:
+            df[col] = self.lists(col)
+        return df[["date", "age", "age_unit", "sex", "reactions", "country", "product_names"]]
+
+
+def open_store(path):
+    return ReportStore(path)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+# Tables de synthèse calculées à l'ingestion (summary.json dans chaque version du store)
+AGE_BINS = [0, 18, 35, 50, 65, 80, 100]
+AGE_LABELS = ['0-18', '19-35', '36-50', '51-65', '66-80', '81-100']
+TOP_N = 10
+
+
+def _table(labels, comptes, n=None):
+    # [libellé, compte] triés par compte décroissant puis par libellé, sans les comptes nuls :
+    # l'ordre ne dépend pas des ids (termes ajoutés en fin de vocabulaire par un append)
+    comptes = np.asarray(comptes)
+    candidats = np.flatnonzero(comptes > 0)
+    if n is not None and len(candidats) > n:
+        seuil = np.partition(comptes[candidats], len(candidats) - n)[len(candidats) - n]
+        candidats = candidats[comptes[candidats] >= seuil]
+    ordre = sorted(candidats.tolist(), key=lambda i: (-comptes[i], str(labels[i])))[:n]
+    return [[str(labels[i]), int(comptes[i])] for i in ordre]
+
+
+def compute_summary(arrays):
+    return summarize(arrays, len(arrays["date"]))
+
+
+def summarize(arrays, n_reports):
+    # `arrays` ne doit contenir que les libellés et comptes (.labels, .vocab, .counts)
+    return {
+        "sex": _table(arrays["sex.labels"], arrays["sex.counts"]),
+        "age": [[label, int(n)] for label, n in zip(AGE_LABELS, arrays["age.counts"])],
+        "top_reactions": _table(arrays["reactions.vocab"], arrays["reactions.counts"], TOP_N),
+        "top_products": _table(arrays["product_names.vocab"], arrays["product_names.counts"], TOP_N),
+        "countries": _table(arrays["country.labels"], arrays["country.counts"]),
+        "key_figures": {
+            "reports": int(n_reports),
+            "countries": int(np.count_nonzero(arrays["country.counts"])),
+            "reactions": int(np.count_nonzero(arrays["reactions.counts"])),
+            "products": int(np.count_nonzero(arrays["product_names.counts"])),
+        },
+    }
+
+
+def summary_table(summary, nom, colonnes):
+    return pd.DataFrame(summary[nom], columns=colonnes)
@@ -0,0 +1,132 @@
+"""Génération de déclarations synthétiques au format de `df_clean.csv`.
+
+Sert à dimensionner le déploiement et aux benchmarks : les mélanges de pays,
+de sexes et d'âges ainsi que les longueurs de listes sont tirés dans les
+distributions empiriques d'un CSV de référence (le jeu de données livré par
+défaut) ; produits et effets suivent une loi de Zipf sur un vocabulaire dont
+la taille croît avec le nombre de déclarations (loi de Heaps), en commençant
+par les termes réels classés par fréquence.
+
+    python -m utils.synthetic 1000000 --output synthetic-1M.csv
+"""
+import os
+import ast
+import argparse
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["date", "age", "age_unit", "sex", "reactions", "country", "product_names"]
+# Environ 25 000 termes préférés dans MedDRA
+MAX_REACTIONS = 25_000
+
+
+def parse_size(texte):
+    # "10k" -> 10_000, "1M" -> 1_000_000
+    texte = str(texte).strip().upper()
+    facteur = {"K": 1_000, "M": 1_000_000}.get(texte[-1:], 1)
+    return int(float(texte.rstrip("KM")) * facteur)
+
+
+def vocabulary_sizes(n_rows):
+    produits = max(int(20 * n_rows ** 0.6), 100)
+    reactions = min(max(int(10 * n_rows ** 0.6), 100), MAX_REACTIONS)
+    return produits, reactions
+
+
+def zipf_probabilities(n, exposant=1.1, decalage=2.7):
+    # Loi de Zipf-Mandelbrot : p(r) ∝ 1 / (r + q)^s
+    poids = 1.0 / (np.arange(1, n + 1) + decalage) ** exposant
+    return poids / poids.sum()
+
+
+class ReferenceProfile:
+    """Distributions empiriques d'un CSV au format df_clean.csv."""
+
+    def __init__(self, path):
+        df = pd.read_csv(path)
+        reactions = df["reactions"].apply(ast.literal_eval)
+        produits = df["product_names"].apply(ast.literal_eval)
+        self.reaction_lengths = reactions.str.len().to_numpy()
+        self.product_lengths = produits.str.len().to_numpy()
+        self.reactions = pd.Series([r for l in reactions for r in l]).value_counts().index.tolist()
+        self.products = pd.Series([p for l in produits for p in l]).value_counts().index.tolist()
+        self.countries = df["country"].to_numpy(dtype=object)
+        self.sexes = df["sex"].to_numpy(dtype=object)
+        self.ages = df["age"].to_numpy(dtype=np.float64)
+        dates = pd.to_datetime(df["date"], errors="coerce").dropna()
+        self.date_range = (dates.min(), dates.max())
+
+
+def _vocabulaire(reels, taille, prefixe):
+    # Termes réels d'abord (les plus fréquents en tête), complétés par des termes fictifs
+    termes = list(reels[:taille])
+    termes += [f"{prefixe} {i:06d}" for i in range(taille - len(termes))]
+    return np.array([repr(t) for t in termes], dtype=object)
+
+
+def _listes(rng, longueurs, cdf, termes_repr):
+    ids = np.searchsorted(cdf, rng.random(int(longueurs.sum())), side="right")
+    ids = np.minimum(ids, len(termes_repr) - 1)
+    morceaux = termes_repr[ids].tolist()
+    resultat, debut = [], 0
+    for n in longueurs.tolist():
+        resultat.append("[" + ", ".join(morceaux[debut:debut + n]) + "]")
+        debut += n
+    return resultat
+
+
+def generate_chunks(n_rows, reference=None, seed=0, chunksize=200_000, zipf_exponent=1.1):
+    """DataFrames successifs de déclarations synthétiques (listes au format texte du CSV)."""
+    from .data_loader import DATA_PATH
+
+    profil = ReferenceProfile(reference or DATA_PATH)
+    rng = np.random.default_rng(seed)
+    n_produits, n_reactions = vocabulary_sizes(n_rows)
+    produits = _vocabulaire(profil.products, n_produits, "SYNTHETIC PRODUCT")
+    reactions = _vocabulaire(profil.reactions, n_reactions, "Synthetic reaction")
+    cdf_produits = np.cumsum(zipf_probabilities(n_produits, zipf_exponent))
+    cdf_reactions = np.cumsum(zipf_probabilities(n_reactions, zipf_exponent))
+
+    debut, fin = (np.datetime64(d.date(), "D").astype(np.int64) for d in profil.date_range)
+    for depart in range(0, n_rows, chunksize):
+        n = min(chunksize, n_rows - depart)
+        # Même déclaration de référence pour l'âge, le sexe et le pays : les mélanges restent cohérents
+        modeles = rng.integers(0, len(profil.ages), n)
+        ages = profil.ages[modeles] + rng.normal(0, 2, n)
+        ages = np.where(np.isnan(ages), np.nan, np.clip(np.round(ages), 0, 99))
+        yield pd.DataFrame({
+            "date": rng.integers(debut, fin + 1, n).astype("datetime64[D]").astype(str),
+            "age": ages,
+            "age_unit": pd.array(np.where(np.isnan(ages), np.nan, 801), dtype="Int64"),
+            "sex": profil.sexes[modeles],
+            "reactions": _listes(rng, rng.choice(profil.reaction_lengths, n), cdf_reactions, reactions),
+            "country": profil.countries[modeles],
+            "product_names": _listes(rng, rng.choice(profil.product_lengths, n), cdf_produits, produits),
+        }, columns=COLUMNS)
+
+
+def write_synthetic(n_rows, output, reference=None, seed=0, chunksize=200_000, zipf_exponent=1.1):
+    # Écriture par blocs dans un fichier temporaire, publié une fois complet
+    tmp = f"{output}.{os.getpid()}.tmp"
+    for i, bloc in enumerate(generate_chunks(n_rows, reference, seed, chunksize, zipf_exponent)):
+        bloc.to_csv(tmp, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    os.replace(tmp, output)
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génération de déclarations FAERS synthétiques")
+    parser.add_argument("rows", help="nombre de déclarations (ex. 100k, 1M)")
+    parser.add_argument("--output", required=True, help="CSV produit")
+    parser.add_argument("--reference", default=None, help="CSV de référence (par défaut le jeu de données de l'application)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--zipf", type=float, default=1.1, help="exposant de la loi de Zipf des produits et effets")
+    args = parser.parse_args(argv)
+
+    n = parse_size(args.rows)
+    write_synthetic(n, args.output, args.reference, seed=args.seed, zipf_exponent=args.zipf)
+    print(f"{n} déclarations synthétiques écrites dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
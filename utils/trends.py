@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from .data_loader import get_store
+from .instrumentation import record_rows
+from .store import LIST_COLUMNS
+
+# Dimensions du cube temporel proposées sur la page Tendances
+DIMENSIONS = {
+    "product_names": "Médicaments",
+    "reactions": "Effets secondaires",
+    "country": "Pays",
+}
+
+
+def _mois(date):
+    return int(np.datetime64(pd.Timestamp(date).to_period("M").start_time, "M").astype(np.int64))
+
+
+def month_range(st=None):
+    # Premier et dernier mois couverts par les déclarations datées
+    st = st or get_store()
+    mois = np.flatnonzero(np.asarray(st["timecube.total"]))
+    if not len(mois):
+        return None, None
+    return (pd.Timestamp(np.datetime64(int(mois[0]), "M")), pd.Timestamp(np.datetime64(int(mois[-1]), "M")))
+
+
+def trend_table(col, termes, debut=None, fin=None, st=None):
+    """Nombre mensuel de déclarations citant chacun des `termes`, lu dans le cube temporel.
+
+    Une ligne par mois entre `debut` et `fin` (inclus, arrondis au mois), une colonne
+    par terme ; les mois sans déclaration valent 0. Le coût ne dépend que du nombre
+    de mois non vides de chaque terme, jamais du nombre de déclarations.
+    """
+    st = st or get_store()
+    if col not in DIMENSIONS:
+        raise ValueError(f"Dimension inconnue : {col}")
+    premier, dernier = month_range(st)
+    if premier is None:
+        # Aucune déclaration datée : même forme de table, sans ligne
+        index = pd.DatetimeIndex([], name="month")
+        return pd.DataFrame(np.zeros((0, len(termes)), dtype=np.int64), index=index, columns=list(termes))
+    m_debut = _mois(debut) if debut is not None else _mois(premier)
+    m_fin = _mois(fin) if fin is not None else _mois(dernier)
+    n_mois = max(m_fin - m_debut + 1, 0)
+
+    ids = st.term_ids(col, termes) if col in LIST_COLUMNS else st.category_ids(col, termes)
+    valeurs = np.zeros((n_mois, len(termes)), dtype=np.int64)
+    for j, terme_id in enumerate(ids.tolist()):
+        if terme_id < 0:
+            continue
+        mois, comptes = st.time_series(col, terme_id)
+        # Les mois d'une ligne CSR sont triés : découpage par recherche dichotomique
+        a, b = np.searchsorted(mois, [m_debut, m_fin + 1])
+        valeurs[np.asarray(mois[a:b], dtype=np.int64) - m_debut, j] = comptes[a:b]
+        record_rows(b - a)
+
+    index = pd.DatetimeIndex(np.arange(m_debut, m_debut + n_mois).astype("datetime64[M]"), name="month")
+    return pd.DataFrame(valeurs, index=index, columns=list(termes))
+
+
+def total_table(debut=None, fin=None, st=None):
+    # Nombre total de déclarations par mois, pour rapporter les séries à l'activité globale
+    st = st or get_store()
+    total = np.asarray(st["timecube.total"], dtype=np.int64)
+    premier, dernier = month_range(st)
+    if premier is None:
+        return pd.Series(dtype=np.int64, index=pd.DatetimeIndex([], name="month"), name="total")
+    m_debut = _mois(debut) if debut is not None else _mois(premier)
+    m_fin = _mois(fin) if fin is not None else _mois(dernier)
+    mois = np.arange(m_debut, m_fin + 1)
+    dans = (mois >= 0) & (mois < len(total))
+    valeurs = np.zeros(len(mois), dtype=np.int64)
+    valeurs[dans] = total[mois[dans]]
+    index = pd.DatetimeIndex(mois.astype("datetime64[M]"), name="month")
+    return pd.Series(valeurs, index=index, name="total")